@@ -1,3 +1,4 @@
+import atexit
 import datetime
 from flask import Flask
 from flask_pymongo import PyMongo
@@ -10,6 +11,17 @@ from routes.order_routes import order_bp, init_mongo as order_init
 from routes.postoffice_routes import postoffice_bp, init_mongo as postoffice_init
 from routes.shipper_routes import shipper_bp, init_mongo as shipper_init
 from routes.api_routes import api_bp, init_mongo as api_init
+from routes.notification_routes import notification_bp, init_mongo as notification_init
+from routes.event_routes import event_bp, init_mongo as event_init
+from services.indexes import ensure_indexes_async
+from services.order_search import backfill_search_keys_async
+from services import dashboard_stats, notifications
+from services.cache import configure_cache
+from services.compression import init_compression
+from services.http_cache import bump_version
+from services.metrics import command_recorder, init_metrics
+from services.serialization import MongoJSONProvider
+from services.locations import location_buffer, ensure_trail_collection
 
 
 app = Flask(__name__)
@@ -28,12 +40,39 @@ def safe_strftime(value, fmt="%Y-%m-%d %H:%M"):
 
 app.jinja_env.filters['strftime'] = safe_strftime
 
+# --- CẤU HÌNH CONNECTION POOL / TIMEOUT (biến môi trường) ---
+def mongo_client_options():
+    options = {
+        'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+        'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+        # Hết connection trong pool: chờ tối đa bấy nhiêu ms rồi báo lỗi thay vì treo request
+        'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000)),
+        'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        'connectTimeoutMS': int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+    }
+    for env, key in (('MONGO_SOCKET_TIMEOUT_MS', 'socketTimeoutMS'),
+                     ('MONGO_MAX_IDLE_TIME_MS', 'maxIdleTimeMS')):
+        if os.environ.get(env):
+            options[key] = int(os.environ[env])
+    return options
+
 # Khởi tạo MongoDB
-mongo = PyMongo(app)
+mongo = PyMongo(app, event_listeners=[command_recorder], **mongo_client_options())
+# PyMongo() gắn BSONProvider (extended JSON: {"$oid": ...}): thay bằng provider trả ObjectId / datetime
+# / Decimal128 dạng JSON thường, dùng orjson nếu có cài
+app.json = MongoJSONProvider(app)
+
+# Đo thời gian request, số lệnh Mongo theo endpoint, /metrics cho Prometheus
+init_metrics(app)
+
+# Cache response JSON (memory hoặc redis theo CACHE_BACKEND)
+configure_cache()
+# Nén gzip/brotli cho JSON lớn
+init_compression(app, int(os.environ.get('COMPRESS_MIN_SIZE', 1024)))
 
 # --- INIT DB CHO CÁC MODULE ---
 with app.app_context():
-    for init_func in [main_init, order_init, postoffice_init, shipper_init, api_init]:
+    for init_func in [main_init, order_init, postoffice_init, shipper_init, api_init, notification_init, event_init]:
         init_func(mongo)
 
 # --- REGISTER BLUEPRINT ---
@@ -42,6 +81,8 @@ app.register_blueprint(order_bp)
 app.register_blueprint(postoffice_bp)
 app.register_blueprint(shipper_bp)
 app.register_blueprint(api_bp)
+app.register_blueprint(notification_bp)
+app.register_blueprint(event_bp)
 
 # Thêm filter Jinja2 cho datetime
 # --- KIỂM TRA KẾT NỐI ---
@@ -49,11 +90,35 @@ with app.app_context():
     try:
         count = mongo.db.orders.count_documents({})
         print(f"✅ Kết nối MongoDB thành công! Tổng đơn hàng: {count}")
+        # Kiểm tra/tạo index theo registry ở thread nền
+        ensure_indexes_async(mongo.db)
+        # Tìm kiếm chỉ dùng search_keys: bổ sung cho đơn chưa có (dữ liệu seed cũ, import tay)
+        backfill_search_keys_async(mongo.db)
+        # Dữ liệu có thể đã bị script import thay đổi khi app tắt: đổi ETag khi khởi động
+        bump_version(mongo.db, 'post_offices', 'shippers')
+        # Đối soát dashboard_stats định kỳ (giây, 0 = tắt)
+        reconcile_interval = int(os.environ.get('STATS_RECONCILE_INTERVAL', 900))
+        if reconcile_interval > 0:
+            dashboard_stats.start_reconciler(mongo.db, reconcile_interval)
+        # Ghi notification theo lô ở thread nền
+        d = notifications.dispatcher
+        d.batch_size = int(os.environ.get('NOTIFY_BATCH_SIZE', d.batch_size))
+        d.flush_interval = float(os.environ.get('NOTIFY_FLUSH_INTERVAL', d.flush_interval))
+        d.max_queue = int(os.environ.get('NOTIFY_QUEUE_SIZE', d.max_queue))
+        d.start(mongo.db)
+        atexit.register(d.stop)
+        # Gộp ping GPS của shipper và ghi xuống DB theo chu kỳ (giây)
+        location_buffer.flush_interval = float(os.environ.get('LOCATION_FLUSH_INTERVAL', 2))
+        location_buffer.trail_interval = float(os.environ.get('LOCATION_TRAIL_INTERVAL', 30))
+        location_buffer.start(mongo.db)
+        atexit.register(location_buffer.stop)
+        ensure_trail_collection(mongo.db)
     except ServerSelectionTimeoutError:
         print("⚠️ Không kết nối được MongoDB!")
     except Exception as e:
         print(f"⚠️ Lỗi khởi động: {e}")
 
 if __name__ == '__main__':
-    # Chạy app Flask thông thường
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Server phát triển; production dùng wsgi.py (xem README)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0',
+            port=int(os.environ.get('PORT', 5000)), threaded=True)
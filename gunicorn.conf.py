@@ -0,0 +1,13 @@
+import os
+
+# Mỗi worker là một process riêng với MongoClient/pool, cache và thread nền riêng.
+# Không bật preload_app: các thread nền (ghi notification, vị trí shipper, đối soát) khởi động khi import app.
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# gthread: mỗi worker phục vụ nhiều request đồng thời (PyMongo nhả GIL khi chờ I/O);
+# mỗi kết nối SSE (/api/events) giữ một thread nên threads cần lớn hơn số client SSE mong đợi
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 16))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+keepalive = 5
+accesslog = '-'
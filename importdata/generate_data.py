@@ -0,0 +1,290 @@
+"""Sinh dữ liệu tổng hợp quy mô lớn (hàng triệu đơn) cho kiểm thử hiệu năng.
+
+Chạy từ thư mục gốc của project:
+
+    python -m importdata.generate_data --orders 1000000 --workers 8 --seed 42 --drop
+
+Cùng --seed (và --chunk-size) luôn sinh ra cùng dữ liệu, không phụ thuộc số worker.
+"""
+import argparse
+import math
+import os
+import random
+import struct
+from datetime import datetime, timedelta, timezone
+from multiprocessing import Pool
+
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+from services.order_search import build_search_keys
+from services.transitions import ALLOWED_TRANSITIONS
+
+# Phân bố trạng thái lệch về đơn đã giao, giống dữ liệu vận hành thực tế
+STATUS_WEIGHTS = [
+    ("DELIVERED", 55),
+    ("IN_TRANSIT", 12),
+    ("PENDING_PICKUP", 10),
+    ("PICKED_UP", 8),
+    ("DELIVERING", 8),
+    ("CANCELLED", 7),
+]
+# Thứ tự lịch sử vận chuyển dẫn tới từng trạng thái
+STATUS_PATH = ["PENDING_PICKUP", "PICKED_UP", "IN_TRANSIT", "DELIVERING", "DELIVERED"]
+# Đơn hủy chỉ hủy được từ các trạng thái mà máy trạng thái cho phép
+CANCELLABLE = [s for s in STATUS_PATH if "CANCELLED" in ALLOWED_TRANSITIONS[s]]
+STATUS_DESC = {
+    "PENDING_PICKUP": "Đơn hàng đã được tạo",
+    "PICKED_UP": "Shipper đã lấy hàng",
+    "IN_TRANSIT": "Đang luân chuyển",
+    "DELIVERING": "Đang giao hàng",
+    "DELIVERED": "Giao hàng thành công",
+    "CANCELLED": "Đơn hàng đã hủy",
+}
+SERVICES = [
+    {"code": "VCN", "name": "Chuyển phát nhanh", "estimated_delivery_time": "1-2 days"},
+    {"code": "VTK", "name": "Chuyển phát tiết kiệm", "estimated_delivery_time": "3-5 days"},
+    {"code": "VHT", "name": "Hỏa tốc", "estimated_delivery_time": "12 hours"},
+]
+CONTENTS = ["Quần áo", "Giày dép", "Sách", "Điện tử", "Mỹ phẩm", "Thực phẩm khô"]
+FAMILY = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ"]
+MIDDLE = ["Văn", "Thị", "Hữu", "Minh", "Ngọc", "Thanh", "Đức", "Quốc"]
+GIVEN = ["An", "Bình", "Cường", "Dũng", "Hà", "Hải", "Hạnh", "Hùng", "Lan", "Linh", "Long", "Mai", "Nam", "Phúc", "Trang", "Tuấn"]
+PROVINCES = [("Hồ Chí Minh", 106.70, 10.78, 50), ("Hà Nội", 105.84, 21.03, 35), ("Đà Nẵng", 108.21, 16.05, 15)]
+
+# Tiền tố cho _id để các collection không dùng chung giá trị
+KIND_ORDER, KIND_SHIPMENT, KIND_TRANSACTION, KIND_OFFICE, KIND_SHIPPER = 1, 2, 3, 4, 5
+
+
+def utc_ts(dt):
+    """Epoch của datetime naive theo UTC (không phụ thuộc múi giờ máy chạy)"""
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def make_oid(ts, kind, n):
+    """ObjectId xác định: 4 byte thời gian + loại + số thứ tự (tái lập được theo seed)"""
+    return ObjectId(struct.pack(">I", int(ts) & 0xFFFFFFFF) + struct.pack(">Q", (kind << 56) | n))
+
+
+def fake_name(rng):
+    return f"{rng.choice(FAMILY)} {rng.choice(MIDDLE)} {rng.choice(GIVEN)}"
+
+
+def fake_phone(rng):
+    return f"+849{rng.randint(0, 99999999):08d}"
+
+
+def pick_province(rng):
+    return rng.choices(PROVINCES, weights=[p[3] for p in PROVINCES])[0]
+
+
+# ==========================================
+# BƯU CỤC & SHIPPER (ít, sinh ở process chính)
+# ==========================================
+def build_post_offices(rng, n, base_ts):
+    offices = []
+    for i in range(n):
+        province, lng, lat, _ = pick_province(rng)
+        offices.append({
+            "_id": make_oid(base_ts, KIND_OFFICE, i),
+            "office_code": f"PO{i + 1:05d}",
+            "name": f"Bưu cục {province} {i + 1:03d}",
+            "phone_number": f"+8428{rng.randint(0, 9999999):07d}",
+            "operating_hours": "07:30 - 21:00",
+            "address": {"street": f"{rng.randint(1, 500)} Lê Lợi", "ward": "", "district": "", "province": province},
+            "location": {"type": "Point", "coordinates": [lng + rng.uniform(-0.15, 0.15), lat + rng.uniform(-0.15, 0.15)]},
+        })
+    return offices
+
+
+def build_shippers(rng, n, offices, base_ts):
+    shippers = []
+    for i in range(n):
+        po = rng.choice(offices)
+        lng, lat = po["location"]["coordinates"]
+        shippers.append({
+            "_id": make_oid(base_ts, KIND_SHIPPER, i),
+            "shipper_code": f"SHP{i + 1:06d}",
+            "full_name": fake_name(rng),
+            "phone_number": f"+84908{i:06d}",
+            "current_post_office_id": po["_id"],
+            "current_location": {"type": "Point", "coordinates": [lng + rng.uniform(-0.03, 0.03), lat + rng.uniform(-0.03, 0.03)]},
+            "status": rng.choices(["ON_DUTY", "ACTIVE", "OFFLINE"], weights=[60, 15, 25])[0],
+            "created_at": datetime.utcfromtimestamp(base_ts),
+            "updated_at": datetime.utcfromtimestamp(base_ts),
+        })
+    return shippers
+
+
+# ==========================================
+# ĐƠN HÀNG / SHIPMENT / TRANSACTION (theo chunk, chạy song song)
+# ==========================================
+def build_order_chunk(seed, chunk_index, start, end, now, days, shippers):
+    rng = random.Random(seed * 1000003 + chunk_index)
+    statuses = [s for s, _ in STATUS_WEIGHTS]
+    weights = [w for _, w in STATUS_WEIGHTS]
+    orders, shipments, transactions = [], [], []
+
+    for i in range(start, end):
+        # Ngày tạo lệch về gần hiện tại (phân phối mũ, trung bình days/6)
+        age_days = min(rng.expovariate(6.0 / days), days)
+        created_at = now - timedelta(days=age_days, seconds=rng.randint(0, 3600))
+        ts = utc_ts(created_at)
+        status = rng.choices(statuses, weights=weights)[0]
+        # Đơn cũ thì gần như đã kết thúc
+        if age_days > 14 and status not in ("DELIVERED", "CANCELLED"):
+            status = "DELIVERED" if rng.random() < 0.9 else "CANCELLED"
+
+        cod = 0 if rng.random() < 0.4 else int(round(rng.lognormvariate(12.6, 0.8), -3))
+        fee = rng.choice([15000, 22000, 30000, 45000, 70000])
+        insurance = 0 if rng.random() < 0.8 else 5000
+        province = pick_province(rng)[0]
+        recipient = fake_name(rng)
+        recipient_phone = fake_phone(rng)
+        shipper = rng.choice(shippers)
+        code = f"VT{created_at:%Y%m%d}{i:07d}"
+        # Trang /track tra cả orders.order_code và shipments.tracking_code bằng cùng một mã
+        tracking_code = code
+        order_id = make_oid(ts, KIND_ORDER, i)
+        updated_at = created_at + timedelta(hours=rng.randint(1, 72))
+
+        orders.append({
+            "_id": order_id,
+            "order_code": code,
+            "tracking_code": tracking_code,
+            "search_keys": build_search_keys(code, recipient, recipient_phone),
+            "sender_info": {"name": fake_name(rng), "phone": fake_phone(rng)},
+            "recipient_info": {"name": recipient, "phone": recipient_phone,
+                               "address": f"{rng.randint(1, 999)} Nguyễn Trãi, {province}"},
+            "parcel": {
+                "weight": round(rng.uniform(0.1, 10.0), 1),
+                "dimensions": {"l": rng.randint(10, 60), "w": rng.randint(10, 60), "h": rng.randint(5, 40)},
+                "contents": rng.choice(CONTENTS),
+                "is_fragile": rng.random() < 0.15,
+                "declared_value": cod or rng.randint(50, 2000) * 1000,
+                "quantity": rng.randint(1, 3),
+            },
+            "service_info": rng.choice(SERVICES),
+            "financials": {"cod_amount": cod, "shipping_fee": fee, "insurance_fee": insurance,
+                           "total_amount": cod + fee + insurance},
+            "current_status": status,
+            "assigned_shipper_code": shipper["shipper_code"],
+            "created_at": created_at,
+            "updated_at": min(updated_at, now),
+            "is_deleted": rng.random() < 0.01,
+        })
+
+        # Lịch sử vận chuyển đến trạng thái hiện tại
+        path = STATUS_PATH[:STATUS_PATH.index(status) + 1] if status in STATUS_PATH \
+            else STATUS_PATH[:STATUS_PATH.index(rng.choice(CANCELLABLE)) + 1] + ["CANCELLED"]
+        t = created_at
+        history = []
+        for step in path:
+            history.append({
+                "status_code": step,
+                "description": STATUS_DESC[step],
+                "timestamp": t,
+                "shipper_code": None if step == "PENDING_PICKUP" else shipper["shipper_code"],
+                "location": None if step == "PENDING_PICKUP" else shipper["current_location"],
+            })
+            t += timedelta(hours=rng.randint(1, 18))
+        shipments.append({
+            "_id": make_oid(ts, KIND_SHIPMENT, i),
+            "order_id": order_id,
+            "tracking_code": tracking_code,
+            "status_history": history,
+            "estimated_delivery_date": created_at + timedelta(days=3),
+            "actual_delivery_date": history[-1]["timestamp"] if status == "DELIVERED" else None,
+            "last_updated_at": history[-1]["timestamp"],
+        })
+
+        if cod:
+            transactions.append({
+                "_id": make_oid(ts, KIND_TRANSACTION, i),
+                "order_id": order_id,
+                "transaction_code": f"TXN{code}",
+                "transaction_type": "COD_COLLECTION",
+                "amount": cod,
+                "currency": "VND",
+                "status": "COMPLETED" if status == "DELIVERED" else "PENDING",
+                "created_at": history[-1]["timestamp"],
+            })
+    return orders, shipments, transactions
+
+
+# --- Worker: mỗi process tự mở MongoClient riêng ---
+_worker = {}
+
+
+def _init_worker(uri, db_name, shippers):
+    _worker["db"] = MongoClient(uri)[db_name]
+    _worker["shippers"] = shippers
+
+
+def _run_chunk(task):
+    seed, chunk_index, start, end, now, days, batch_size = task
+    db = _worker["db"]
+    orders, shipments, transactions = build_order_chunk(seed, chunk_index, start, end, now, days, _worker["shippers"])
+    for coll, docs in ((db.orders, orders), (db.shipments, shipments), (db.transactions, transactions)):
+        for k in range(0, len(docs), batch_size):
+            coll.insert_many(docs[k:k + batch_size], ordered=False)
+    return len(orders), len(shipments), len(transactions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu tổng hợp quy mô lớn cho ViettelPost Demo")
+    parser.add_argument("--uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017/ViettelPost_DB"))
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--post-offices", type=int, default=200)
+    parser.add_argument("--shippers", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365, help="Khoảng thời gian created_at trải dài (ngày)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--chunk-size", type=int, default=20000, help="Số đơn mỗi tác vụ của worker")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Số document mỗi lệnh insert_many")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--now", help="Mốc thời gian ISO cố định (mặc định 2025-01-01) để tái lập dữ liệu")
+    parser.add_argument("--drop", action="store_true", help="Xóa các collection trước khi sinh")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    db = client.get_default_database()
+    now = datetime.fromisoformat(args.now) if args.now else datetime(2025, 1, 1)
+    base_ts = utc_ts(now - timedelta(days=args.days))
+    rng = random.Random(args.seed)
+
+    if args.drop:
+        for name in ("orders", "shipments", "transactions", "post_offices", "shippers", "dashboard_stats", "counters"):
+            db[name].drop()
+
+    offices = build_post_offices(rng, args.post_offices, base_ts)
+    shippers = build_shippers(rng, args.shippers, offices, base_ts)
+    db.post_offices.insert_many(offices, ordered=False)
+    db.shippers.insert_many(shippers, ordered=False)
+    print(f"✅ Đã tạo {len(offices)} bưu cục, {len(shippers)} shipper.")
+
+    n_chunks = math.ceil(args.orders / args.chunk_size)
+    tasks = [(args.seed, c, c * args.chunk_size, min((c + 1) * args.chunk_size, args.orders),
+              now, args.days, args.batch_size) for c in range(n_chunks)]
+    lite_shippers = [{"shipper_code": s["shipper_code"], "current_location": s["current_location"]} for s in shippers]
+
+    started = datetime.now()
+    totals = [0, 0, 0]
+    with Pool(args.workers, initializer=_init_worker, initargs=(args.uri, db.name, lite_shippers)) as pool:
+        for done, counts in enumerate(pool.imap_unordered(_run_chunk, tasks), start=1):
+            totals = [a + b for a, b in zip(totals, counts)]
+            rate = totals[0] / max((datetime.now() - started).total_seconds(), 1e-6)
+            print(f"⏳ {done}/{n_chunks} chunk - {totals[0]:,} đơn ({rate:,.0f} đơn/giây)", end="\r")
+
+    print(f"\n✅ Đã tạo {totals[0]:,} đơn, {totals[1]:,} shipment, {totals[2]:,} giao dịch "
+          f"trong {(datetime.now() - started).total_seconds():.1f}s.")
+
+    # Đồng bộ bộ đếm dashboard và ETag với dữ liệu mới
+    from services import dashboard_stats
+    from services.http_cache import bump_version
+    dashboard_stats.reconcile(db)
+    bump_version(db, "post_offices", "shippers")
+    print("🎉 HOÀN TẤT!")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,10 @@ from pymongo import MongoClient
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 import random
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.order_search import build_search_keys
 
 client = MongoClient("mongodb://localhost:27017")
 db = client["ViettelPost_DB"]
@@ -53,6 +57,7 @@ for i in range(20):
     order = {
         "_id": order_id,
         "order_code": f"VT202500{str(100+i).zfill(2)}",
+        "search_keys": build_search_keys(f"VT202500{str(100+i).zfill(2)}", f"Nguyen Recipient {i}", f"+84907{str(654321+i).zfill(5)}"),
         "sender_id": user["_id"],
         "sender_info": { "name": user["full_name"], "phone": user["phone_number"], "address": user["address_book"][0]["street"] },
         "recipient_info": { "name": f"Nguyen Recipient {i}", "phone": f"+84907{str(654321+i).zfill(5)}", "address": f"{200+i} Nguyen Trai, Q5, HCM" },
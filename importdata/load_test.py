@@ -0,0 +1,184 @@
+"""Bộ phát tải HTTP: phát lại tổ hợp các route của app và đo throughput, p50/p95/p99.
+
+    python -m importdata.load_test --base-url http://127.0.0.1:5000 --duration 60 --concurrency 32
+
+Tỷ trọng route chỉnh bằng --mix "track=10,orders_page=4,..." (tên trong DEFAULT_MIX).
+Các placeholder {code}, {phone}, {name}, {cursor} được lấy mẫu từ /api/orders/all.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Tên route -> (path mẫu, tỷ trọng mặc định)
+DEFAULT_MIX = {
+    "dashboard": ("/", 2),
+    "orders_page": ("/api/orders?page=1&limit=25", 4),
+    "orders_deep_page": ("/api/orders?page=200&limit=25", 1),
+    "orders_cursor": ("/api/orders?limit=25&cursor={cursor}", 2),
+    "orders_status": ("/api/orders?status=IN_TRANSIT&limit=25", 2),
+    "orders_search_phone": ("/api/orders?q={phone}", 2),
+    "orders_search_code": ("/api/orders?q={code}", 2),
+    "orders_search_name": ("/api/orders?q={name}", 1),
+    "orders_all": ("/api/orders/all", 1),
+    "orders_summary": ("/api/orders/summary", 2),
+    "transactions_cod": ("/api/transactions/cod", 1),
+    "track_page": ("/track?code={code}", 3),
+    "track_api": ("/api/track/{code}", 10),
+    "track_unknown": ("/api/track/NOPE{rand}", 2),
+    "postoffices_all": ("/api/postoffices/all", 3),
+    "shippers_all": ("/api/shippers/all", 2),
+    "shippers_active": ("/api/shippers/active", 2),
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def parse_mix(spec):
+    mix = {name: weight for name, (_, weight) in DEFAULT_MIX.items()}
+    if spec:
+        for part in spec.split(","):
+            name, _, weight = part.partition("=")
+            name = name.strip()
+            if name not in DEFAULT_MIX:
+                raise SystemExit(f"Route không tồn tại trong DEFAULT_MIX: {name}")
+            mix[name] = float(weight or 0)
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+def fetch_samples(base_url, timeout):
+    """Lấy mẫu mã đơn / số điện thoại / tên người nhận có thật để điền placeholder"""
+    with urllib.request.urlopen(base_url + "/api/orders/all", timeout=timeout) as resp:
+        rows = json.loads(resp.read())
+    samples = {"code": [], "phone": [], "name": [], "cursor": [""]}
+    for r in rows:
+        if r.get("order_code"):
+            samples["code"].append(r["order_code"])
+        if r.get("recipient_phone"):
+            samples["phone"].append("".join(c for c in r["recipient_phone"] if c.isdigit())[:7])
+        if r.get("recipient_name"):
+            samples["name"].append(r["recipient_name"].split()[-1])
+    try:
+        with urllib.request.urlopen(base_url + "/api/orders?limit=25&cursor=", timeout=timeout) as resp:
+            token = json.loads(resp.read()).get("next_cursor")
+            if token:
+                samples["cursor"].append(token)
+    except (urllib.error.URLError, ValueError):
+        pass
+    for k, v in samples.items():
+        if not v:
+            samples[k] = ["0"]
+    return samples
+
+
+def render_path(template, samples, rng):
+    values = {k: urllib.parse.quote(rng.choice(v)) for k, v in samples.items()}
+    values["rand"] = str(rng.randint(0, 10 ** 9))
+    return template.format(**values)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.status = defaultdict(lambda: defaultdict(int))
+
+    def add(self, route, seconds, status):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            self.status[route][status] += 1
+            if status == 0 or status >= 500:
+                self.errors[route] += 1
+
+
+def worker(base_url, mix, samples, deadline, recorder, timeout, seed):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        route = rng.choices(names, weights=weights)[0]
+        url = base_url + render_path(DEFAULT_MIX[route][0], samples, rng)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as resp:
+                resp.read()
+                status = resp.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            status = 0
+        recorder.add(route, time.perf_counter() - started, status)
+
+
+def report(recorder, elapsed):
+    rows = []
+    for route in sorted(recorder.latencies):
+        lat = sorted(recorder.latencies[route])
+        rows.append({
+            "route": route,
+            "requests": len(lat),
+            "rps": round(len(lat) / elapsed, 2),
+            "errors": recorder.errors[route],
+            "p50_ms": round(percentile(lat, 50) * 1000, 2),
+            "p95_ms": round(percentile(lat, 95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 99) * 1000, 2),
+            "max_ms": round(lat[-1] * 1000, 2),
+            "status": dict(recorder.status[route]),
+        })
+    total = sum(r["requests"] for r in rows)
+    return {"elapsed_s": round(elapsed, 2), "total_requests": total,
+            "total_rps": round(total / elapsed, 2), "routes": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test các route HTTP của ViettelPost Demo")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--duration", type=float, default=30, help="Thời gian chạy (giây)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", help='Tỷ trọng route, ví dụ "track_api=10,orders_page=2,dashboard=0"')
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Ghi báo cáo JSON ra file")
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip("/")
+    mix = parse_mix(args.mix)
+    samples = fetch_samples(base_url, args.timeout)
+    recorder = Recorder()
+
+    print(f"⏳ Chạy {args.duration:.0f}s với {args.concurrency} luồng trên {len(mix)} route...")
+    started = time.monotonic()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        futures = [pool.submit(worker, base_url, mix, samples, deadline, recorder, args.timeout, args.seed + i)
+                   for i in range(args.concurrency)]
+        # Lỗi trong worker (không phải lỗi HTTP) được ném lại ở đây thay vì bị nuốt mất
+        for future in futures:
+            future.result()
+    result = report(recorder, time.monotonic() - started)
+
+    print(f"\n{'route':<22}{'req':>8}{'rps':>9}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for r in result["routes"]:
+        print(f"{r['route']:<22}{r['requests']:>8}{r['rps']:>9}{r['errors']:>6}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+    print(f"\n✅ Tổng: {result['total_requests']} request, {result['total_rps']} req/s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
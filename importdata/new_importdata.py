@@ -3,6 +3,10 @@ from pymongo import MongoClient
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 from faker import Faker
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.order_search import build_search_keys
 
 # Cấu hình kết nối
 client = MongoClient("mongodb://localhost:27017")
@@ -127,14 +131,17 @@ for i in range(120):
 
     order_id = ObjectId()
     tracking_code = f"VTP{datetime.now().year}{str(i+10000)}"
+    order_code = f"OD{random.randint(100000,999999)}"
+    recipient = { "name": fake.name(), "phone": fake.phone_number(), "address": fake.address() }
     
     orders.append({
         "_id": order_id,
-        "order_code": f"OD{random.randint(100000,999999)}",
+        "order_code": order_code,
+        "search_keys": build_search_keys(order_code, recipient["name"], recipient["phone"]),
         "tracking_code": tracking_code,
         "sender_id": sender["_id"],
         "sender_info": { "name": sender["full_name"], "phone": sender["phone_number"], "address": sender["default_address"] },
-        "recipient_info": { "name": fake.name(), "phone": fake.phone_number(), "address": fake.address() },
+        "recipient_info": recipient,
         "service_info": svc,
         "financials": { "cod_amount": cod_amount, "shipping_fee": shipping_fee, "total_payment": total_amount },
         "current_status": current_status,
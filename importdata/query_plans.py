@@ -0,0 +1,405 @@
+"""Benchmark kế hoạch truy vấn: chạy explain("executionStats") cho mọi truy vấn của các blueprint.
+
+    python -m importdata.query_plans --uri mongodb://localhost:27017/ViettelPost_Bench --scale 10k
+    python -m importdata.query_plans --scale 1m --json report.json --compare baseline.json
+
+Dữ liệu được sinh bằng importdata.generate_data (cùng --seed luôn ra cùng dữ liệu) vào DB riêng,
+sau đó tạo index theo services.indexes. Truy vấn thất bại khi kế hoạch thắng có COLLSCAN (trừ
+truy vấn vốn đọc cả collection) hoặc docsExamined / nReturned vượt ngưỡng. Mã thoát khác 0 khi có lỗi.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+
+from services import archive, export, geo, tracking
+from services.dashboard_stats import COD_ID, SEARCH_COUNT_CAP, STATS_ID
+from services.events import NOTIFICATION_FIELDS, ORDER_FIELDS
+from services.indexes import ensure_indexes
+from services.notifications import INBOX_FIELDS, inbox_filter
+from services.orders import list_filter
+from services.pagination import ORDER_SORT, encode_cursor, page_sort, seek_filter
+from services.schemas import ORDER_ROW, ORDER_TABLE, POST_OFFICE, SHIPPER
+from services.shippers import ACTIVE_SHIPPER_FIELDS, active_shippers_pipeline, shippers_with_office_pipeline
+from services.transitions import history_entry, shipment_history_update, transition_filter
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_MAX_RATIO = 10.0
+
+
+class Query:
+    """Một truy vấn của app: build(samples) -> command document gửi cho db.command"""
+
+    def __init__(self, name, route, build, full_scan=False, max_ratio=DEFAULT_MAX_RATIO, write=False, allowance=None):
+        self.name = name
+        self.route = route
+        self.build = build
+        # Truy vấn đọc cả collection theo thiết kế (danh sách bưu cục...): COLLSCAN được chấp nhận
+        self.full_scan = full_scan
+        self.max_ratio = max_ratio
+        # Lệnh ghi chỉ chạy explain (explain không áp dụng thay đổi)
+        self.write = write
+        # Vấn đề đã biết (lý do): vượt ngưỡng chỉ báo "known", chỉ thất bại khi hồi quy so với --compare
+        self.allowance = allowance
+
+
+def find(coll, filter=None, projection=None, sort=None, skip=0, limit=0):
+    cmd = {"find": coll, "filter": filter or {}}
+    if projection:
+        cmd["projection"] = projection
+    if sort:
+        cmd["sort"] = dict(sort)
+    if skip:
+        cmd["skip"] = skip
+    if limit:
+        cmd["limit"] = limit
+    return cmd
+
+
+def aggregate(coll, pipeline):
+    return {"aggregate": coll, "pipeline": pipeline, "cursor": {}}
+
+
+def count(coll, query, limit=0):
+    cmd = {"count": coll, "query": query}
+    if limit:
+        cmd["limit"] = limit
+    return cmd
+
+
+def find_and_modify(coll, query, update):
+    return {"findAndModify": coll, "query": query, "update": update}
+
+
+def update(coll, q, u, upsert=False):
+    return {"update": coll, "updates": [{"q": q, "u": u, "upsert": upsert}]}
+
+
+def orders_list(q="", status="", cursor=None, page=1, limit=10):
+    """Truy vấn của GET /api/orders (order_bp, routes/order_routes.api_orders)"""
+    query = list_filter(q, status)[0]
+    if cursor:
+        return find("orders", and_(query, seek_filter(cursor)), ORDER_TABLE.projection, ORDER_SORT, limit=limit + 1)
+    return find("orders", query, ORDER_TABLE.projection, ORDER_SORT, skip=(page - 1) * limit, limit=limit)
+
+
+def and_(*parts):
+    parts = [p for p in parts if p]
+    return parts[0] if len(parts) == 1 else {"$and": parts}
+
+
+def near(s):
+    return {"type": "Point", "coordinates": s["point"]}
+
+
+def bbox(s):
+    lng, lat = s["point"]
+    return lng - 0.05, lat - 0.05, lng + 0.05, lat + 0.05
+
+
+def export_find(kind, args):
+    """Truy vấn của GET /api/export/<kind> (services.export.iter_docs)"""
+    spec = export.EXPORTS[kind]
+    return find(spec.collection, export.build_filter(kind, args), spec.schema.projection, export.EXPORT_SORT)
+
+
+# --- DANH MỤC TRUY VẤN THEO BLUEPRINT ---
+# Filter / projection / pipeline lấy từ cùng các hàm và Schema mà route dùng để không lệch với app
+QUERIES = [
+    # main_routes
+    Query("main.dashboard_stats", "GET /", lambda s: find("dashboard_stats", {"_id": {"$in": [STATS_ID, COD_ID]}})),
+    Query("main.recent_orders", "GET /", lambda s: find("orders", sort=[("created_at", -1)], limit=10)),
+    Query("main.track", "GET /track", lambda s: aggregate("orders", tracking._pipeline(s["order_code"]))),
+    Query("main.track_unknown", "GET /track", lambda s: aggregate("orders", tracking._pipeline("NOPE0000000000"))),
+    Query("main.track_archive", "GET /track (archive fallback)", lambda s: aggregate(
+        "orders_archive", tracking._pipeline("NOPE0000000000", "shipments_archive"))),
+    Query("main.postoffices_all", "GET /api/postoffices/all",
+          lambda s: find("post_offices", projection=POST_OFFICE.projection), full_scan=True),
+    Query("main.shippers_active", "GET /api/shippers/active",
+          lambda s: aggregate("shippers", active_shippers_pipeline(ACTIVE_SHIPPER_FIELDS))),
+
+    # order_routes
+    Query("order.list_page", "GET /api/orders", lambda s: orders_list()),
+    Query("order.list_status", "GET /api/orders?status=", lambda s: orders_list(status="IN_TRANSIT")),
+    Query("order.list_cursor", "GET /api/orders?cursor=", lambda s: orders_list(cursor=s["cursor"])),
+    Query("order.list_deep_page", "GET /api/orders?page=200", lambda s: orders_list(page=200),
+          allowance="phân trang offset: docs examined tăng theo số trang (dùng ?cursor=)"),
+    Query("order.search_phone", "GET /api/orders?q=<phone>", lambda s: orders_list(s["phone_prefix"])),
+    Query("order.search_phone_count", "GET /api/orders?q=<phone>",
+          lambda s: count("orders", list_filter(s["phone_prefix"])[0], SEARCH_COUNT_CAP)),
+    Query("order.search_code", "GET /api/orders?q=<code>", lambda s: orders_list(s["order_code"])),
+    Query("order.search_name", "GET /api/orders?q=<name>", lambda s: orders_list(s["name"])),
+    Query("order.edit_load", "GET /orders/edit/<oid>", lambda s: find("orders", {"_id": s["order_id"]}, limit=1)),
+    Query("order.quick_status", "PATCH /api/orders/<oid>/status", lambda s: find_and_modify(
+        "orders", transition_filter(s["order_id"], "DELIVERED"), {"$set": {"current_status": "DELIVERED"}}), write=True),
+    Query("order.status_history", "PATCH /api/orders/<oid>/status", lambda s: update(
+        "shipments", *shipment_history_update({"_id": s["order_id"], "order_code": s["order_code"]}, "DELIVERED",
+                                              history_entry("DELIVERED", s["recent"])), upsert=True), write=True),
+    Query("order.soft_delete", "DELETE /api/orders/<oid>", lambda s: find_and_modify(
+        "orders", {"_id": s["order_id"], "is_deleted": {"$ne": True}}, {"$set": {"is_deleted": True}}), write=True),
+
+    # api_routes
+    Query("api.orders_all", "GET /api/orders/all",
+          lambda s: find("orders", projection=ORDER_ROW.projection, sort=[("created_at", -1)], limit=200)),
+    Query("api.bulk_status_lookup", "POST /api/orders/status/bulk",
+          lambda s: find("orders", {"order_code": {"$in": s["order_codes"]}, "is_deleted": {"$ne": True}},
+                         {"order_code": 1, "current_status": 1, "tracking_code": 1})),
+    Query("api.export_orders", "GET /api/export/orders?status=&date_from=&date_to=",
+          lambda s: export_find("orders", {"status": "DELIVERED", "date_from": s["month_start"],
+                                           "date_to": s["month_end"]})),
+    Query("api.export_transactions", "GET /api/export/transactions?date_from=&date_to=",
+          lambda s: export_find("transactions", {"date_from": s["month_start"], "date_to": s["month_end"]})),
+    Query("api.notifications_inbox", "GET /api/notifications/<user>",
+          lambda s: find("notifications", inbox_filter(s["user_id"]), INBOX_FIELDS, page_sort("timestamp"),
+                         limit=21)),
+    Query("api.notifications_unread", "GET /api/notifications/<user>?unread=1",
+          lambda s: find("notifications", inbox_filter(s["user_id"], True), INBOX_FIELDS, page_sort("timestamp"),
+                         limit=21)),
+    Query("events.poll_orders", "GET /api/events (polling)",
+          lambda s: find("orders", {"updated_at": {"$gte": s["recent"]}}, ORDER_FIELDS, [("updated_at", 1)])),
+    Query("events.poll_notifications", "GET /api/events (polling)",
+          lambda s: find("notifications", {"_id": {"$gt": s["notification_id"]}}, NOTIFICATION_FIELDS,
+                         [("_id", 1)], limit=1000)),
+
+    Query("archive.candidates", "python -m services.archive",
+          lambda s: find("orders", archive.candidate_filter(s["recent"]), {"_id": 1}, limit=1000)),
+
+    # postoffice_routes
+    Query("postoffice.page", "GET /postoffices", lambda s: find("post_offices"), full_scan=True),
+    Query("postoffice.code_check", "POST /postoffices/new",
+          lambda s: find("post_offices", {"office_code": s["office_code"]}, limit=1)),
+    Query("postoffice.nearby", "GET /api/postoffices/nearby",
+          lambda s: aggregate("post_offices", geo.post_offices_within_pipeline(*s["point"], 5))),
+    Query("postoffice.viewport", "GET /api/postoffices/viewport",
+          lambda s: find("post_offices", geo.viewport_filter("location", bbox(s)), geo.OFFICE_FIELDS,
+                         limit=geo.MAX_RESULTS)),
+
+    # shipper_routes
+    Query("shipper.page", "GET /shippers", lambda s: aggregate("shippers", shippers_with_office_pipeline()),
+          full_scan=True),
+    Query("shipper.all", "GET /api/shippers/all",
+          lambda s: aggregate("shippers", shippers_with_office_pipeline(SHIPPER.projection)), full_scan=True),
+    Query("shipper.nearest", "GET /api/shippers/nearest",
+          lambda s: aggregate("shippers", geo.nearest_shippers_pipeline(*s["point"]))),
+    Query("shipper.viewport", "GET /api/shippers/viewport",
+          lambda s: find("shippers", geo.viewport_filter("current_location", bbox(s)), geo.SHIPPER_FIELDS,
+                         limit=geo.MAX_RESULTS)),
+    Query("shipper.location_flush", "POST /api/shippers/locations (flush)", lambda s: update(
+        "shippers", {"shipper_code": s["shipper_code"]}, {"$set": {"current_location": near(s)}}), write=True),
+]
+
+
+# --- PHÂN TÍCH EXPLAIN ---
+def _walk(node, key):
+    """Mọi giá trị của key trong cây explain"""
+    if isinstance(node, dict):
+        for k, v in node.items():
+            if k == key:
+                yield v
+            yield from _walk(v, key)
+    elif isinstance(node, list):
+        for v in node:
+            yield from _walk(v, key)
+
+
+def plan_stages(explain):
+    stages = []
+    for plan in _walk(explain, "winningPlan"):
+        stages.extend(s for s in _walk(plan, "stage") if isinstance(s, str))
+    return stages
+
+
+def summarize(explain):
+    stats = list(_walk(explain, "executionStats"))
+    examined = sum(s.get("totalDocsExamined", 0) for s in stats if isinstance(s, dict))
+    keys = sum(s.get("totalKeysExamined", 0) for s in stats if isinstance(s, dict))
+    # nReturned: của pipeline/truy vấn ngoài cùng (stage đầu tiên có executionStats)
+    returned = stats[0].get("nReturned", 0) if stats and isinstance(stats[0], dict) else 0
+    millis = max([s.get("executionTimeMillis", 0) for s in stats if isinstance(s, dict)] or [0])
+    stages = plan_stages(explain)
+    return {
+        "plan": sorted(set(stages)),
+        "collscan": "COLLSCAN" in stages,
+        "docs_examined": examined,
+        "keys_examined": keys,
+        "n_returned": returned,
+        "explain_ms": millis,
+    }
+
+
+def run_query(db, query, samples, repeat):
+    cmd = query.build(samples)
+    explain = db.command("explain", cmd, verbosity="executionStats")
+    result = summarize(explain)
+    result["route"] = query.route
+    result["ratio"] = round(result["docs_examined"] / max(result["n_returned"], 1), 2)
+
+    if not query.write:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            reply = db.command(cmd)
+            cursor_id = (reply.get("cursor") or {}).get("id")
+            if cursor_id:
+                db.command("killCursors", cmd.get("find") or cmd.get("aggregate"), cursors=[cursor_id])
+            timings.append((time.perf_counter() - started) * 1000)
+        result["wall_ms_p50"] = round(statistics.median(timings), 3)
+        result["wall_ms_max"] = round(max(timings), 3)
+
+    reasons = []
+    if result["collscan"] and not query.full_scan:
+        reasons.append("COLLSCAN")
+    if query.max_ratio is not None and not query.full_scan and result["ratio"] > query.max_ratio:
+        reasons.append(f"docs examined/returned {result['ratio']} > {query.max_ratio}")
+    result["status"] = ("known" if query.allowance else "fail") if reasons else "pass"
+    if reasons and query.allowance:
+        reasons.append(f"allowed: {query.allowance}")
+    result["reasons"] = reasons
+    return result
+
+
+# --- DỮ LIỆU ---
+def seed(args, db):
+    """Sinh dữ liệu bằng importdata.generate_data (subprocess để dùng multiprocessing của nó)"""
+    cmd = [sys.executable, "-m", "importdata.generate_data", "--uri", args.uri, "--orders", str(args.orders),
+           "--post-offices", str(args.post_offices), "--shippers", str(args.shippers),
+           "--seed", str(args.seed), "--drop"]
+    print("⏳", " ".join(cmd))
+    subprocess.run(cmd, check=True)
+
+    # generate_data không sinh notification: thêm một lượng tương đương dữ liệu app tạo ra
+    rng = random.Random(args.seed)
+    codes = [o["order_code"] for o in db.orders.find({}, {"order_code": 1}).limit(args.orders // 20 or 1)]
+    db.notifications.drop()
+    now = datetime(2025, 1, 1)
+    docs = [{"user_id": f"user{rng.randrange(200)}", "order_code": c, "type": "ORDER_CREATED",
+             "message": "New order created", "timestamp": now - timedelta(minutes=i),
+             "is_read": rng.random() < 0.7} for i, c in enumerate(codes)]
+    if docs:
+        db.notifications.insert_many(docs, ordered=False)
+
+
+def collect_samples(db, seed_value):
+    rng = random.Random(seed_value)
+    total = db.orders.estimated_document_count()
+    order = next(db.orders.find({}, {"order_code": 1, "recipient_info": 1}).skip(rng.randrange(max(total, 1))).limit(1))
+    mid = next(db.orders.find({}, {"created_at": 1}).sort(ORDER_SORT).skip(min(total // 2, 10_000)).limit(1))
+    office = db.post_offices.find_one({}, {"office_code": 1, "location": 1})
+    shipper = db.shippers.find_one({}, {"shipper_code": 1})
+    notif = db.notifications.find_one({}, {"user_id": 1}) or {"_id": ObjectId(), "user_id": "user0"}
+    codes = [o["order_code"] for o in db.orders.find({}, {"order_code": 1}).limit(500)]
+    ri = order.get("recipient_info") or {}
+    phone = "".join(c for c in ri.get("phone", "") if c.isdigit())
+    return {
+        "order_id": order["_id"],
+        "order_code": order["order_code"],
+        "phone_prefix": phone[:7] or "0900000",
+        "name": (ri.get("name") or "Nguyen").split()[-1],
+        "cursor": encode_cursor(mid),
+        "order_codes": codes,
+        "office_code": office["office_code"],
+        "point": office["location"]["coordinates"],
+        "shipper_code": shipper["shipper_code"],
+        "user_id": notif["user_id"],
+        "notification_id": notif["_id"],
+        "recent": datetime(2025, 1, 1) - timedelta(minutes=5),
+        "month_start": "2024-12-01",
+        "month_end": "2024-12-31",
+    }
+
+
+# --- SO SÁNH VỚI BÁO CÁO TRƯỚC ---
+def compare(current, baseline, max_slowdown):
+    """Trả về danh sách hồi quy so với baseline (kế hoạch xấu đi, docs examined / thời gian tăng)"""
+    regressions = []
+    for name, cur in current["queries"].items():
+        old = baseline.get("queries", {}).get(name)
+        if not old:
+            continue
+        if cur["collscan"] and not old["collscan"]:
+            regressions.append(f"{name}: plan regressed to COLLSCAN ({old['plan']} -> {cur['plan']})")
+        if cur["docs_examined"] > max(old["docs_examined"], 1) * max_slowdown:
+            regressions.append(f"{name}: docs examined {old['docs_examined']} -> {cur['docs_examined']}")
+        if cur.get("wall_ms_p50") and old.get("wall_ms_p50") and \
+                cur["wall_ms_p50"] > max(old["wall_ms_p50"], 1.0) * max_slowdown:
+            regressions.append(f"{name}: p50 {old['wall_ms_p50']}ms -> {cur['wall_ms_p50']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark kế hoạch truy vấn (explain executionStats)")
+    parser.add_argument("--uri", default=os.environ.get("BENCH_MONGO_URI", "mongodb://localhost:27017/ViettelPost_Bench"))
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k")
+    parser.add_argument("--orders", type=int, help="Số đơn (ghi đè --scale)")
+    parser.add_argument("--post-offices", type=int, default=200)
+    parser.add_argument("--shippers", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reseed", action="store_true", help="Sinh lại dữ liệu kể cả khi DB đã đủ số đơn")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần chạy mỗi truy vấn để đo thời gian")
+    parser.add_argument("--only", help="Chỉ chạy các truy vấn có tên bắt đầu bằng tiền tố này (vd. order.)")
+    parser.add_argument("--json", help="Ghi báo cáo JSON ra file")
+    parser.add_argument("--compare", help="Báo cáo JSON trước đó để so sánh")
+    parser.add_argument("--max-slowdown", type=float, default=1.5,
+                        help="Hệ số tăng tối đa của docs examined / p50 so với --compare")
+    args = parser.parse_args()
+    args.orders = args.orders or SCALES[args.scale]
+
+    db = MongoClient(args.uri).get_default_database()
+    if args.reseed or db.orders.estimated_document_count() != args.orders:
+        seed(args, db)
+    ensured, errors = ensure_indexes(db)
+    if errors:
+        print(f"⚠️ {len(errors)} index không tạo được")
+
+    samples = collect_samples(db, args.seed)
+    queries = [q for q in QUERIES if not args.only or q.name.startswith(args.only)]
+    report = {
+        "meta": {
+            "created": datetime.utcnow().isoformat(),
+            "orders": args.orders,
+            "seed": args.seed,
+            "mongodb": db.client.server_info().get("version"),
+            "python": platform.python_version(),
+        },
+        "queries": {},
+    }
+
+    print(f"\n{'query':<30}{'plan':<42}{'examined':>10}{'returned':>10}{'ratio':>9}{'p50 ms':>9}  status")
+    for q in queries:
+        r = run_query(db, q, samples, args.repeat)
+        report["queries"][q.name] = r
+        plan = ",".join(r["plan"])[:40]
+        print(f"{q.name:<30}{plan:<42}{r['docs_examined']:>10}{r['n_returned']:>10}{r['ratio']:>9}"
+              f"{r.get('wall_ms_p50', '-'):>9}  {r['status']}{' - ' + '; '.join(r['reasons']) if r['reasons'] else ''}")
+
+    failed = [name for name, r in report["queries"].items() if r["status"] == "fail"]
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_slowdown)
+        report["regressions"] = regressions
+        for line in regressions:
+            print("📉", line)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+    if failed or regressions:
+        print(f"\n❌ {len(failed)} truy vấn lỗi, {len(regressions)} hồi quy")
+        sys.exit(1)
+    known = [name for name, r in report["queries"].items() if r["status"] == "known"]
+    print(f"\n✅ {len(queries) - len(known)} truy vấn đạt" + (f", {len(known)} vấn đề đã biết (allowance)" if known else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
-from flask import Blueprint, jsonify, request, abort
+import os
+from flask import Blueprint, Response, jsonify, request, abort
 from bson.objectid import ObjectId
 from datetime import datetime
-from math import ceil
+from services import dashboard_stats, export, notifications, tracking, transitions
+from services.cache import response_cache, invalidate_order
+from services.order_import import import_stream, DEFAULT_CHUNK_SIZE
+from services.schemas import ORDER_ROW
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 db = None
@@ -10,11 +14,6 @@ def init_mongo(mongo):
     global db
     db = mongo.db
 
-def safe_datetime(dt):
-    if isinstance(dt, datetime):
-        return dt.isoformat()
-    return dt or None
-
 def safe_get(d, keys, default=None):
     """Lấy giá trị nested dict an toàn"""
     for k in keys:
@@ -39,22 +38,30 @@ def update_order_status():
     except Exception:
         abort(400, 'Invalid order_id')
 
-    # Cập nhật trạng thái đơn
-    order = db.orders.find_one_and_update(
-        {"_id": order_oid},
-        {"$set": {"current_status": new_status, "updated_at": datetime.utcnow()}},
-        return_document=True
-    )
-    if not order:
-        abort(404, 'Order not found')
+    # Cập nhật trạng thái đơn qua máy trạng thái (kiểm tra trạng thái trước + ghi status_history)
+    try:
+        before = transitions.transition(db, order_oid, new_status,
+                                        shipper_code=data.get('shipper_code'), location=data.get('location'))
+    except transitions.TransitionError as e:
+        abort(404 if e.reason == transitions.NOT_FOUND else 400, str(e))
+    if before.get('current_status') == new_status:
+        # Đã ở trạng thái này: không đổi gì, không gửi thông báo
+        return jsonify({"status": "ok", "unchanged": True})
+    order = dict(before, current_status=new_status)
+
+    # Lưu notification vào MongoDB (ghi theo lô ở thread nền)
+    notifications.publish_many(db, status_notifications(order, new_status))
+
+    return jsonify({"status": "ok"})
 
-    # Tạo notification
+def status_notifications(order, new_status, now=None):
+    """Notification cho người liên quan khi đơn đổi trạng thái"""
     notif = {
         "user_ids": [],
         "type": f"ORDER_{new_status}",
         "order_code": order.get('order_code'),
         "message": "",
-        "timestamp": datetime.utcnow(),
+        "timestamp": now or datetime.utcnow(),
         "is_read": False
     }
 
@@ -69,14 +76,80 @@ def update_order_status():
         notif['message'] = "Đơn hàng sắp được giao trong 30 phút"
         if 'recipient_info' in order:
             recipients.append(order['recipient_info'].get('name'))
+    return [dict(notif, user_id=r) for r in recipients]
 
-    # Lưu notification vào MongoDB
-    for r in recipients:
-        n = notif.copy()
-        n['user_id'] = r
-        db.notifications.insert_one(n)
+# --------- Bulk Status Update (bảng kê / quét tại bưu cục) ----------
+BULK_STATUS_MAX = int(os.environ.get('BULK_STATUS_MAX', 5000))
+NOTIFY_FIELDS = ['sender.full_name', 'assigned_shipper_code', 'recipient_info.name']
 
-    return jsonify({"status": "ok"})
+@api_bp.route('/orders/status/bulk', methods=['POST'])
+def api_bulk_status():
+    data = request.get_json(silent=True) or {}
+    new_status = data.get('status')
+    order_codes, order_ids = data.get('order_codes'), data.get('order_ids')
+    keys = order_codes if order_codes is not None else order_ids
+    if not new_status or not isinstance(keys, list) or not keys:
+        abort(400, 'status and a non-empty order_codes or order_ids list required')
+    if len(keys) > BULK_STATUS_MAX:
+        abort(413, f'At most {BULK_STATUS_MAX} orders per request')
+
+    try:
+        results, changed = transitions.transition_many(
+            db, new_status,
+            order_ids=None if order_codes is not None else [str(k) for k in keys],
+            order_codes=[str(k) for k in order_codes] if order_codes is not None else None,
+            shipper_code=data.get('shipper_code'), location=data.get('location'), note=data.get('note'),
+            fields=NOTIFY_FIELDS
+        )
+    except transitions.TransitionError as e:
+        abort(400, str(e))
+
+    now = datetime.utcnow()
+    notifications.publish_many(db, [n for order in changed for n in status_notifications(order, new_status, now)])
+
+    updated = sum(1 for r in results if r['outcome'] == transitions.OK and not (r.get('duplicate') or r.get('unchanged')))
+    return jsonify({
+        'status': new_status,
+        'requested': len(keys),
+        'updated': updated,
+        'failed': sum(1 for r in results if r['outcome'] != transitions.OK),
+        'results': results
+    })
+
+# --------- Bulk Import Orders (NDJSON / CSV) ----------
+@api_bp.route('/orders/import', methods=['POST'])
+def api_orders_import():
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'csv' if 'csv' in (request.mimetype or '') else 'ndjson'
+    if fmt not in ('ndjson', 'csv'):
+        abort(400, 'format must be ndjson or csv')
+    try:
+        chunk_size = int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE))
+    except ValueError:
+        abort(400, 'Invalid chunk_size')
+
+    report = import_stream(db, request.stream, fmt, chunk_size)
+    if report['inserted']:
+        invalidate_order()
+    return jsonify(report), (200 if report['inserted'] or not report['failed'] else 400)
+
+# --------- Export Orders / COD Transactions (NDJSON / CSV, stream) ----------
+@api_bp.route('/export/<kind>')
+def api_export(kind):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        abort(400, 'format must be ndjson or csv')
+    try:
+        query = export.build_filter(kind, request.args)
+        batch_size = export.parse_batch_size(request.args.get('batch_size'))
+    except export.ExportError as e:
+        abort(400, str(e))
+
+    filename = f"{kind}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    archived = request.args.get('source') == 'archive'
+    return Response(export.stream(db, kind, fmt, query, batch_size, archived), mimetype=export.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 # --------- Send Notification ----------
 @api_bp.route('/send_notification', methods=['POST'])
@@ -95,127 +168,38 @@ def send_notification():
         "timestamp": datetime.utcnow(),
         "is_read": False
     }
-    db.notifications.insert_one(notif)
+    notifications.publish(db, notif)
     return jsonify({"status": "ok"})
 
 # --------- Orders Summary ----------
 @api_bp.route('/orders/summary')
+@response_cache.cached('orders_summary')
 def api_orders_summary():
-    pipeline = [{'$group': {'_id': '$current_status', 'count': {'$sum': 1}}}]
-    data = list(db.orders.aggregate(pipeline))
-    return jsonify(data)
+    stats = dashboard_stats.get_order_stats(db)
+    return jsonify(dashboard_stats.status_counts(stats))
 
 # --------- COD Transactions ----------
 @api_bp.route('/transactions/cod')
+@response_cache.cached('cod')
 def api_transactions_cod():
-    pipeline = [
-        {'$match': {'transaction_type': 'COD_COLLECTION', 'status': 'COMPLETED'}},
-        {'$group': {'_id': None, 'total_cod': {'$sum': '$amount'}}}
-    ]
-    data = list(db.transactions.aggregate(pipeline))
-    total = float(data[0]['total_cod']) if data else 0
-    return jsonify({'total_cod': total})
-
-# --------- PostOffices ----------
-@api_bp.route('/postoffices/all')
-def api_postoffices_all():
-    offices = list(db.postoffices.find({}, {'name':1,'office_code':1,'location':1,'address':1,'operating_hours':1}))
-    for o in offices:
-        o['_id'] = str(o['_id'])
-    return jsonify(offices)
-
-# --------- Shippers ----------
-@api_bp.route('/shippers/active')
-def api_shippers_active():
-    shps = list(db.shippers.find({'status': {'$in': ['ON_DUTY','ACTIVE']}}))
-    for s in shps:
-        s['_id'] = str(s.get('_id'))
-        po_id = s.get('current_post_office_id')
-        s['current_post_office_name'] = None
-        if po_id:
-            po = db.postoffices.find_one({'_id': po_id}, {'name':1})
-            if po:
-                s['current_post_office_name'] = po.get('name')
-    return jsonify(shps)
+    stats = dashboard_stats.get_cod_stats(db)
+    return jsonify({'total_cod': float(stats.get('total_cod') or 0)})
 
 # --------- Track Order ----------
 @api_bp.route('/track/<code>')
 def api_track(code):
-    order = db.orders.find_one({'order_code': code})
-    shipment = db.shipments.find_one({'tracking_code': code})
-    if order: order['_id'] = str(order.get('_id'))
-    if shipment: shipment['_id'] = str(shipment.get('_id'))
+    order, shipment = tracking.track(db, code)
     return jsonify({'order': order, 'shipment': shipment})
 
 # --------- Orders for Frontend Table ----------
 @api_bp.route('/orders/all')
 def api_orders_all():
-    cursor = db.orders.find({}, {'order_code':1, 'recipient_info':1, 'current_status':1, 'created_at':1}).sort('created_at', -1).limit(200)
-    orders = []
-    for o in cursor:
-        o['_id'] = str(o.get('_id'))
-        ri = o.get('recipient_info') or {}
-        orders.append({
-            '_id': o['_id'],
-            'order_code': o.get('order_code'),
-            'recipient_name': ri.get('name'),
-            'recipient_phone': ri.get('phone'),
-            'current_status': o.get('current_status'),
-            'created_at': safe_datetime(o.get('created_at'))
-        })
-    return jsonify(orders)
-
-# --------- Orders with Pagination ----------
-@api_bp.route('/orders')
-def api_orders():
-    try:
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 25))
-        if page < 1: page = 1
-        if limit < 1 or limit > 500: limit = 25
-    except Exception:
-        page, limit = 1, 25
-
-    q = request.args.get('q', '').strip()
-    status = request.args.get('status', '').strip()
-
-    query = {}
-    if q:
-        query['$or'] = [
-            {'order_code': {'$regex': q, '$options':'i'}},
-            {'recipient_info.name': {'$regex': q, '$options':'i'}},
-            {'recipient_info.phone': {'$regex': q, '$options':'i'}}
-        ]
-    if status:
-        query['current_status'] = status
-
-    total = db.orders.count_documents(query)
-    cursor = db.orders.find(query, {'order_code':1,'recipient_info':1,'current_status':1,'created_at':1}) \
-                     .sort('created_at', -1) \
-                     .skip((page-1)*limit).limit(limit)
-    orders = []
-    for o in cursor:
-        o['_id'] = str(o.get('_id'))
-        ri = o.get('recipient_info') or {}
-        orders.append({
-            '_id': o['_id'],
-            'order_code': o.get('order_code'),
-            'recipient_name': ri.get('name'),
-            'recipient_phone': ri.get('phone'),
-            'current_status': o.get('current_status'),
-            'created_at': safe_datetime(o.get('created_at'))
-        })
-
-    pages = ceil(total/limit) if limit else 1
-    return jsonify({'page': page, 'limit': limit, 'total': total, 'pages': pages, 'data': orders})
-
-# --------- Delete Order ----------
-@api_bp.route('/orders/<oid>', methods=['DELETE'])
-def api_orders_delete(oid):
-    try:
-        res = db.orders.delete_one({'_id': ObjectId(oid)})
-    except Exception:
-        abort(400,'Invalid id')
-    if res.deleted_count == 0:
-        return jsonify({'deleted': False}), 404
-    return jsonify({'deleted': True})
+    cursor = db.orders.find({}, ORDER_ROW.projection).sort('created_at', -1).limit(200)
+    return jsonify(ORDER_ROW.dump_many(cursor))
+
+# --------- Cache Stats ----------
+@api_bp.route('/cache/stats')
+def api_cache_stats():
+    stats = response_cache.stats()
+    stats['tracking'] = dict(tracking.tracking_cache.stats, entries=len(tracking.tracking_cache))
+    return jsonify(stats)
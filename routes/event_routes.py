@@ -0,0 +1,50 @@
+import json
+import queue
+from flask import Blueprint, Response, request, stream_with_context
+from services.events import event_hub
+
+event_bp = Blueprint('events', __name__)
+db = None
+
+def init_mongo(mongo):
+    global db
+    db = mongo.db
+    event_hub.init(db)
+
+HEARTBEAT_SECONDS = 15
+
+
+def _format(kind, payload):
+    return f"event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+
+# --- SSE: trạng thái đơn + notification mới ---
+# /api/events?kinds=order_status,notification&user_id=demo_user
+@event_bp.route('/api/events')
+def events_stream():
+    kinds = [k for k in (request.args.get('kinds') or '').split(',') if k]
+    sub = event_hub.subscribe(kinds, request.args.get('user_id'))
+
+    def generate():
+        try:
+            # Gợi ý trình duyệt tự kết nối lại sau 3s nếu mất kết nối
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    kind, payload = sub.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield _format(kind, payload)
+        finally:
+            event_hub.unsubscribe(sub)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@event_bp.route('/api/events/stats')
+def events_stats():
+    return {'clients': event_hub.clients(), 'mode': event_hub.mode}
@@ -2,6 +2,12 @@ import datetime
 from flask import Blueprint, render_template, request, jsonify
 from pymongo.errors import PyMongoError
 from bson.objectid import ObjectId
+from services.shippers import ACTIVE_SHIPPER_FIELDS, find_active_shippers
+from services import dashboard_stats, tracking
+from services.cache import response_cache
+from services.http_cache import conditional
+from services.parallel import run_parallel
+from services.schemas import POST_OFFICE
 
 main_bp = Blueprint('main', __name__)
 db = None
@@ -18,36 +24,28 @@ def index():
     cod_total = 0
     recent_orders = []
 
-    # Tổng đơn hàng
-    try:
-        total_orders = db.orders.count_documents({})
-    except PyMongoError as e:
-        print("⚠️ Lỗi đếm tổng đơn:", e)
+    # Hai truy vấn độc lập chạy song song: dashboard_stats và 10 đơn gần nhất
+    stats, recent = run_parallel(
+        lambda: dashboard_stats.get_dashboard(db),
+        lambda: list(db.orders.find().sort('created_at', -1).limit(10)),
+        return_exceptions=True
+    )
 
-    # Thống kê trạng thái
+    # Tổng đơn, thống kê trạng thái, tổng COD: đọc từ dashboard_stats
     try:
-        orders_by_status = list(db.orders.aggregate([
-            {'$group': {'_id': '$current_status', 'count': {'$sum': 1}}},
-            {'$sort': {'count': -1}}
-        ]))
+        if isinstance(stats, Exception):
+            raise stats
+        total_orders = stats['total_orders']
+        orders_by_status = stats['orders_by_status']
+        cod_total = stats['cod_total']
     except PyMongoError as e:
-        print("⚠️ Lỗi tổng hợp trạng thái:", e)
-
-    # Tổng COD
-    try:
-        cod_cursor = db.transactions.aggregate([
-            {'$match': {'transaction_type': 'COD_COLLECTION', 'status': 'COMPLETED'}},
-            {'$group': {'_id': None, 'total_cod': {'$sum': '$amount'}}}
-        ])
-        cod_total = next(cod_cursor, {}).get('total_cod', 0) or 0
-        cod_total = float(cod_total)
-    except (PyMongoError, ValueError, TypeError) as e:
-        print("⚠️ Lỗi tính tổng COD:", e)
-        cod_total = 0
+        print("⚠️ Lỗi đọc dashboard_stats:", e)
 
     # 10 đơn gần nhất
     try:
-        recent_orders = list(db.orders.find().sort('created_at', -1).limit(10))
+        if isinstance(recent, Exception):
+            raise recent
+        recent_orders = recent
         # Convert ObjectId và datetime để template render dễ
         for o in recent_orders:
             o['_id'] = str(o.get('_id'))
@@ -74,25 +72,22 @@ def track_form():
     order, shipment = None, None
     if code:
         try:
-            order = db.orders.find_one({'order_code': code})
-            shipment = db.shipments.find_one({'tracking_code': code})
-            # Convert _id và datetime
-            if order:
-                order['_id'] = str(order['_id'])
-                if 'created_at' in order:
-                    order['created_at'] = order['created_at'].isoformat()
-            if shipment:
-                shipment['_id'] = str(shipment['_id'])
+            order, shipment = tracking.track(db, code)
+            # Kết quả dùng chung trong cache: convert datetime trên bản sao
+            if order and 'created_at' in order:
+                order = dict(order, created_at=order['created_at'].isoformat())
         except PyMongoError as e:
             print(f"⚠️ Lỗi truy vấn tracking code {code}:", e)
     return render_template('track.html', order=order, shipment=shipment, code=code)
 
 # --- API cho post offices ---
 @main_bp.route('/api/postoffices/all')
+@conditional(lambda: db, 'post_offices')
+@response_cache.cached('postoffices')
 def postoffices_api():
     try:
         # Query trực tiếp MongoDB, trả về dữ liệu thuần
-        offices = list(db.post_offices.find({}, {"_id":0}))
+        offices = list(db.post_offices.find({}, POST_OFFICE.projection))
         return jsonify(offices)
     except PyMongoError as e:
         print("⚠️ Lỗi fetch post offices:", e)
@@ -100,24 +95,10 @@ def postoffices_api():
 
 # --- API cho shippers active ---
 @main_bp.route('/api/shippers/active')
+@conditional(lambda: db, 'shippers', 'post_offices')
 def shippers_active_api():
     try:
-        shps = list(db.shippers.find({'status': {'$in': ['ON_DUTY','ACTIVE']}}))
-        result = []
-        for s in shps:
-            po_name = None
-            po_id = s.get('current_post_office_id')
-            if po_id:
-                po = db.post_offices.find_one({'_id': po_id}, {'name':1})
-                if po:
-                    po_name = po.get('name')
-            result.append({
-                'shipper_code': s.get('shipper_code'),
-                'full_name': s.get('full_name'),
-                'phone_number': s.get('phone_number'),
-                'current_post_office_name': po_name,
-                'status': s.get('status')
-            })
+        result = find_active_shippers(db, fields=ACTIVE_SHIPPER_FIELDS)
         return jsonify(result)
     except PyMongoError as e:
         print("⚠️ Lỗi fetch shippers:", e)
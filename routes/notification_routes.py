@@ -0,0 +1,93 @@
+import datetime
+from flask import Blueprint, jsonify, request, abort
+from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
+from services.pagination import fetch_page, InvalidCursor
+from services import notifications
+
+notification_bp = Blueprint('notifications', __name__)
+db = None
+
+def init_mongo(mongo):
+    global db
+    db = mongo.db
+
+
+def _serialize(docs):
+    for d in docs:
+        d['_id'] = str(d['_id'])
+    return docs
+
+
+def _inbox_page(user_id, unread_only, limit, cursor):
+    return fetch_page(db.notifications, notifications.inbox_filter(user_id, unread_only),
+                      notifications.INBOX_FIELDS, limit, cursor, field='timestamp')
+
+
+# --- Danh sách notification (keyset theo timestamp) ---
+@notification_bp.route('/api/notifications/<user_id>')
+def inbox(user_id):
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        abort(400, 'Invalid limit')
+    unread_only = request.args.get('unread') in ('1', 'true')
+    try:
+        docs, next_cursor = _inbox_page(user_id, unread_only, limit, request.args.get('cursor'))
+        unread = notifications.unread_count(db, user_id)
+    except InvalidCursor as e:
+        abort(400, str(e))
+    except PyMongoError as e:
+        print("⚠️ Lỗi lấy notification:", e)
+        return jsonify({'error': 'database error'}), 500
+    return jsonify({'notifications': _serialize(docs), 'next_cursor': next_cursor, 'unread': unread})
+
+
+# --- Số chưa đọc: đọc từ bộ đếm, không quét collection ---
+@notification_bp.route('/api/notifications/<user_id>/unread_count')
+def inbox_unread_count(user_id):
+    return jsonify({'user_id': user_id, 'unread': notifications.unread_count(db, user_id)})
+
+
+# --- Đánh dấu đã đọc ---
+@notification_bp.route('/api/notifications/<user_id>/read_all', methods=['POST'])
+def inbox_read_all(user_id):
+    modified = notifications.mark_read(db, user_id)
+    return jsonify({'marked': modified, 'unread': notifications.unread_count(db, user_id)})
+
+
+@notification_bp.route('/api/notifications/<user_id>/<nid>/read', methods=['POST'])
+def inbox_read_one(user_id, nid):
+    try:
+        oid = ObjectId(nid)
+    except Exception:
+        abort(400, 'Invalid notification id')
+    modified = notifications.mark_read(db, user_id, oid)
+    return jsonify({'marked': modified, 'unread': notifications.unread_count(db, user_id)})
+
+
+# --- Tương thích trang Redis demo ---
+@notification_bp.route('/redis/notify/unread/<user_id>')
+def redis_demo_unread(user_id):
+    try:
+        docs, _ = _inbox_page(user_id, True, 10, None)
+    except PyMongoError as e:
+        print("⚠️ Lỗi lấy notification:", e)
+        docs = []
+    return jsonify({'notifications': _serialize(docs), 'unread': notifications.unread_count(db, user_id)})
+
+
+@notification_bp.route('/redis/notify/send', methods=['POST'])
+def redis_demo_send():
+    data = request.get_json(silent=True) or {}
+    message = (data.get('message') or '').strip()
+    if not message:
+        abort(400, 'message required')
+    notifications.publish(db, {
+        "user_id": data.get('user_id', 'demo_user'),
+        "type": "DEMO",
+        "message": message,
+        "timestamp": datetime.datetime.utcnow(),
+        "is_read": False
+    })
+    return jsonify({"status": "ok"})
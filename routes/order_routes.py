@@ -1,119 +1,44 @@
 import datetime
+import os
 from flask import Blueprint, render_template, request, redirect, jsonify, flash
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from services.pagination import ORDER_SORT, fetch_page, InvalidCursor, MAX_PAGE_SIZE
+from services import dashboard_stats, notifications, transitions
+from services.orders import build_order, get_empty_order, list_filter, validate_order_data
+from services.cache import invalidate_order
+from services.code_allocator import OrderCodeAllocator
+from services.parallel import run_parallel
+from services.schemas import ORDER_TABLE
 
 order_bp = Blueprint('orders', __name__)
 db = None
 
 # --- CẤU HÌNH ---
-ALLOWED_TRANSITIONS = {
-    "PENDING_PICKUP": ["PICKED_UP", "CANCELLED"],
-    "PICKED_UP": ["IN_TRANSIT", "CANCELLED"],
-    "IN_TRANSIT": ["DELIVERING", "PICKED_UP"],
-    "DELIVERING": ["DELIVERED", "IN_TRANSIT", "CANCELLED"],
-    "DELIVERED": [],
-    "CANCELLED": []
-}
+# Máy trạng thái dùng chung với api_bp: services/transitions.py
+ALLOWED_TRANSITIONS = transitions.ALLOWED_TRANSITIONS
 
 def init_mongo(mongo):
     global db
     db = mongo.db
 
 # --- HÀM HỖ TRỢ ---
-def safe_float(value):
-    try:
-        if value is None or str(value).strip() == "":
-            return 0.0
-        return float(value)
-    except (ValueError, TypeError):
-        return 0.0
-
+# Dựng / kiểm tra document đơn: services/orders.py (dùng chung với /api/orders/import)
 def validate_status_transition(current_status, new_status):
     if current_status == new_status:
         return True
-    allowed_next = ALLOWED_TRANSITIONS.get(current_status, [])
-    return new_status in allowed_next
+    return transitions.is_allowed(current_status, new_status)
 
 # --- SINH ORDER CODE (Thuần MongoDB) ---
+# Mỗi process thuê khối ORDER_CODE_LEASE_SIZE số thứ tự một lần thay vì $inc cho từng đơn
+order_codes = OrderCodeAllocator(int(os.environ.get('ORDER_CODE_LEASE_SIZE', 20)))
+# on_insert: form GET không sinh mã, mã chỉ được cấp khi lưu; prefill: điền sẵn mã trên form
+ORDER_CODE_MODE = os.environ.get('ORDER_CODE_MODE', 'on_insert')
+
 def generate_order_code():
-    now = datetime.datetime.now()
-    date_str = now.strftime("%Y%m%d")
-    counter = db.counters.find_one_and_update(
-        {"_id": date_str},
-        {"$inc": {"seq": 1}},
-        upsert=True,
-        return_document=True
-    )
-    seq = counter.get("seq", 1)
-    return f"VT{date_str}{seq:04d}"
-
-# --- TẠO ORDER MỚI ---
-def build_order(data):
-    code = data.get('order_code', '').strip()
-    if not code:
-        code = generate_order_code()
-
-    return {
-        "order_code": code,
-        "recipient_info": {
-            "name": data.get('recipient_name', ''),
-            "phone": data.get('recipient_phone', ''),
-            "address": data.get('recipient_address', '')
-        },
-        "sender_info": {
-            "name": data.get('sender_name', ''),
-            "phone": data.get('sender_phone', '')
-        },
-        "parcel": {
-            "weight": safe_float(data.get("weight")),
-            "dimensions": {
-                "l": safe_float(data.get("dim_l")),
-                "w": safe_float(data.get("dim_w")),
-                "h": safe_float(data.get("dim_h"))
-            },
-            "contents": data.get("contents", ""),
-            "is_fragile": data.get("is_fragile") == "on",
-            "declared_value": safe_float(data.get("declared_value")),
-            "quantity": safe_float(data.get("quantity", 1))
-        },
-        "financials": {
-            "cod_amount": safe_float(data.get("cod_amount")),
-            "shipping_fee": safe_float(data.get("shipping_fee")),
-            "insurance_fee": safe_float(data.get("insurance_fee")),
-            "total_amount": (
-                safe_float(data.get("cod_amount")) +
-                safe_float(data.get("shipping_fee")) +
-                safe_float(data.get("insurance_fee"))
-            )
-        },
-        "current_status": "PENDING_PICKUP",
-        "created_at": datetime.datetime.utcnow(),
-        "updated_at": datetime.datetime.utcnow(),
-        "is_deleted": False
-    }
-
-# --- TẠO ORDER CHO FORM (GET) ---
-def get_empty_order(code=""):
-    return {
-        "order_code": code,
-        "recipient_info": {"name": "", "phone": "", "address": ""},
-        "sender_info": {"name": "", "phone": ""},
-        "parcel": {
-            "weight": 0,
-            "dimensions": {"l": 0, "w": 0, "h": 0},
-            "contents": "",
-            "is_fragile": False,
-            "declared_value": 0,
-            "quantity": 1
-        },
-        "financials": {
-            "cod_amount": 0,
-            "shipping_fee": 0,
-            "insurance_fee": 0,
-            "total_amount": 0
-        },
-        "current_status": "PENDING_PICKUP"
-    }
+    return order_codes.next_code(db)
+
 # --- API UPDATE STATUS (QUICK EDIT) ---
 @order_bp.route('/api/orders/<oid>/status', methods=['PATCH'])
 def api_update_status(oid):
@@ -124,31 +49,17 @@ def api_update_status(oid):
         if not new_status:
             return jsonify({'error': 'Missing status'}), 400
 
-        order = db.orders.find_one({'_id': ObjectId(oid)})
-        if not order:
-            return jsonify({'error': 'Order not found'}), 404
-
+        # Một find_one_and_update có điều kiện trạng thái trước + ghi status_history
+        try:
+            order = transitions.transition(db, oid, new_status)
+        except transitions.TransitionError as e:
+            return jsonify({'error': str(e)}), (404 if e.reason == transitions.NOT_FOUND else 400)
         current_status = order.get('current_status')
-
-        # Kiểm tra logic chuyển trạng thái
-        if not validate_status_transition(current_status, new_status):
-            return jsonify({
-                'error': f'Không thể chuyển từ {current_status} sang {new_status}'
-            }), 400
-
-        # Cập nhật DB
-        db.orders.update_one(
-            {'_id': ObjectId(oid)},
-            {
-                '$set': {
-                    'current_status': new_status,
-                    'updated_at': datetime.datetime.utcnow()
-                }
-            }
-        )
+        if current_status == new_status:
+            return jsonify({'success': True, 'new_status': new_status, 'unchanged': True})
 
         # Tạo thông báo
-        db.notifications.insert_one({
+        notifications.publish(db, {
             "order_id": oid,
             "order_code": order.get("order_code"),
             "type": "STATUS_UPDATED",
@@ -169,31 +80,36 @@ def api_orders():
     try:
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 10))
+        if page < 1: page = 1
+        if limit < 1 or limit > MAX_PAGE_SIZE: limit = 10
         q = request.args.get('q', '').strip()
         status = request.args.get('status', '').strip()
 
-        query = {"$or": [{"is_deleted": False}, {"is_deleted": {"$exists": False}}]}
+        query, search_mode = list_filter(q, status, scan=request.args.get('scan') == '1')
 
-        if q:
-            query["$or"] = [
-                {"order_code": {"$regex": q, "$options": "i"}},
-                {"recipient_info.name": {"$regex": q, "$options": "i"}},
-                {"recipient_info.phone": {"$regex": q, "$options": "i"}},
-            ]
-        if status:
-            query["current_status"] = status
+        # Chế độ cursor: seek theo (created_at, _id), không count/skip
+        if 'cursor' in request.args or request.args.get('mode') == 'cursor':
+            try:
+                orders, next_cursor = fetch_page(db.orders, query, ORDER_TABLE.projection, limit,
+                                                 request.args.get('cursor') or None)
+            except InvalidCursor as e:
+                return jsonify({"data": [], "error": str(e)}), 400
+            return jsonify({"data": ORDER_TABLE.dump_many(orders), "limit": limit, "next_cursor": next_cursor,
+                            "search_mode": search_mode})
 
-        total = db.orders.count_documents(query)
-        pages = (total + limit - 1) // limit
         skip = (page - 1) * limit
-        orders = list(db.orders.find(query).sort("created_at", -1).skip(skip).limit(limit))
-
-        for o in orders:
-            o["_id"] = str(o["_id"])
-            created = o.get("created_at")
-            o["created_at_str"] = o["created_at"].strftime("%Y-%m-%d %H:%M:%S") if o.get("created_at") else ""
+        # Đếm tổng và lấy trang chạy song song
+        (total, strategy, approximate), orders = run_parallel(
+            lambda: dashboard_stats.count_orders(
+                db, query, status=status, search=bool(q), exact=request.args.get('exact') == '1'),
+            lambda: list(db.orders.find(query, ORDER_TABLE.projection)
+                         .sort(ORDER_SORT).skip(skip).limit(limit))
+        )
+        pages = (total + limit - 1) // limit
 
-        return jsonify({"data": orders, "page": page, "pages": pages})
+        return jsonify({"data": ORDER_TABLE.dump_many(orders), "page": page, "pages": pages, "total": total,
+                        "total_strategy": strategy, "total_approximate": approximate,
+                        "search_mode": search_mode})
     except Exception as e:
         return jsonify({"data": [], "page": 1, "pages": 0, "error": str(e)}), 500
 
@@ -210,13 +126,28 @@ def order_new():
     if request.method == 'POST':
         try:
             data = request.form.to_dict()
+            errors = validate_order_data(data)
+            if errors:
+                flash("Invalid order: " + "; ".join(errors), "danger")
+                return render_template('order_form.html', order=build_order(data))
+            allocated = None
             if not data.get('order_code'):
-                data['order_code'] = generate_order_code()
+                allocated = data['order_code'] = generate_order_code()
             order = build_order(data)
-            result = db.orders.insert_one(order)
+            try:
+                result = db.orders.insert_one(order)
+            except Exception as insert_error:
+                # Insert thất bại: trả mã về allocator để không mất số thứ tự (trừ khi mã đã bị trùng)
+                if allocated:
+                    if not isinstance(insert_error, DuplicateKeyError):
+                        order_codes.release(allocated)
+                    data['order_code'] = ''
+                raise
+            dashboard_stats.record_created(db, order["current_status"])
+            invalidate_order(order["order_code"], order.get("tracking_code"))
 
             # Notification lưu MongoDB
-            db.notifications.insert_one({
+            notifications.publish(db, {
                 "order_id": str(result.inserted_id),
                 "order_code": order["order_code"],
                 "type": "ORDER_CREATED",
@@ -229,9 +160,9 @@ def order_new():
             return redirect('/orders')
         except Exception as e:
             flash(f"Error creating order: {e}", "danger")
-            return render_template('order_form.html', order=data)
+            return render_template('order_form.html', order=build_order(data))
 
-    empty_order = get_empty_order(generate_order_code())
+    empty_order = get_empty_order(generate_order_code() if ORDER_CODE_MODE == 'prefill' else "")
     return render_template('order_form.html', order=empty_order)
 
 # --- EDIT ORDER ---
@@ -256,13 +187,32 @@ def order_edit(oid):
                 flash(f"Cannot change status from {order.get('current_status')} to {new_status}", "warning")
                 return render_template('order_form.html', order=order)
 
-            updated_order = build_order(data)
-            updated_order['current_status'] = new_status
+            updated_order = build_order(data, str(data.get('order_code') or '').strip() or generate_order_code())
+            # Trạng thái chỉ đổi qua máy trạng thái (có điều kiện + status_history), các field khác ghi riêng
+            updated_order.pop('current_status')
             updated_order['updated_at'] = datetime.datetime.utcnow()
 
-            db.orders.update_one({'_id': ObjectId(oid)}, {'$set': updated_order})
-
-            db.notifications.insert_one({
+            before = db.orders.find_one_and_update({'_id': ObjectId(oid)}, {'$set': updated_order},
+                                                   return_document=ReturnDocument.BEFORE)
+            if not before:
+                flash("Order not found", "danger")
+                return redirect('/orders')
+            if before.get('is_deleted') is True:
+                # build_order đặt lại is_deleted=False nên đơn quay về nhóm live
+                dashboard_stats.record_removed(db, before.get('current_status'), deleted=True)
+                dashboard_stats.record_created(db, before.get('current_status'))
+            invalidate_order(before.get('order_code'), before.get('tracking_code'))
+            if updated_order["order_code"] != before.get('order_code'):
+                invalidate_order(updated_order["order_code"])
+
+            if new_status != before.get('current_status'):
+                try:
+                    transitions.transition(db, oid, new_status)
+                except transitions.TransitionError as e:
+                    flash(f"Order details saved, status not changed: {e}", "warning")
+                    return redirect('/orders')
+
+            notifications.publish(db, {
                 "order_id": oid,
                 "order_code": updated_order["order_code"],
                 "type": "ORDER_UPDATED",
@@ -282,7 +232,15 @@ def order_edit(oid):
 @order_bp.route('/api/orders/<oid>', methods=['DELETE'])
 def order_delete(oid):
     try:
-        db.orders.update_one({'_id': ObjectId(oid)}, {'$set': {"is_deleted": True}})
+        before = db.orders.find_one_and_update(
+            {'_id': ObjectId(oid), 'is_deleted': {'$ne': True}},
+            {'$set': {"is_deleted": True}},
+            projection={'order_code': 1, 'tracking_code': 1, 'current_status': 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before:
+            dashboard_stats.record_deleted(db, before.get('current_status'))
+            invalidate_order(before.get('order_code'), before.get('tracking_code'))
         return '', 204
     except Exception as e:
         return jsonify({'error': str(e)}), 500
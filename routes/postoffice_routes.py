@@ -1,6 +1,9 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
 from pymongo.errors import PyMongoError
 from bson.objectid import ObjectId
+from services.cache import invalidate_postoffices
+from services.http_cache import conditional, bump_version
+from services import geo
 
 postoffice_bp = Blueprint('postoffices', __name__)
 db = None
@@ -9,6 +12,11 @@ def init_mongo(mongo):
     global db
     db = mongo.db
 
+# --- Helper: Sau mỗi lần ghi, đổi ETag và xóa cache của API bản đồ ---
+def after_office_write():
+    bump_version(db, 'post_offices')
+    invalidate_postoffices()
+
 # --- Helper: Xây dựng object Post Office từ Form Data ---
 def build_office_data(data):
     try:
@@ -49,12 +57,34 @@ def postoffices_page():
         offices = []
     return render_template('postoffices.html', offices=offices)
 
-# --- 2. API Trả về JSON (Cho Map) ---
-@postoffice_bp.route('/api/postoffices/all')
-def postoffices_api():
+# --- 2. API JSON cho map: /api/postoffices/all do main_bp phục vụ ---
+# --- 2b. API bưu cục trong bán kính R km (sắp theo khoảng cách) ---
+@postoffice_bp.route('/api/postoffices/nearby')
+def postoffices_nearby():
+    try:
+        lng, lat = geo.parse_point(request.args.get('lat'), request.args.get('lng'))
+        km = min(max(float(request.args.get('km', 5)), 0.01), 500)
+    except (geo.GeoQueryError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
     try:
-        offices = list(db.post_offices.find({}, {"_id": 0}))
-    except PyMongoError:
+        offices = geo.post_offices_within(db, lng, lat, km)
+    except PyMongoError as e:
+        print("⚠️ Lỗi tìm bưu cục gần:", e)
+        offices = []
+    return jsonify(offices)
+
+# --- 2c. API bưu cục trong khung nhìn bản đồ ---
+@postoffice_bp.route('/api/postoffices/viewport')
+@conditional(lambda: db, 'post_offices')
+def postoffices_viewport():
+    try:
+        bbox = geo.parse_bbox(request.args.get('bbox'))
+    except geo.GeoQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        offices = geo.in_viewport(db.post_offices, 'location', bbox, geo.OFFICE_FIELDS)
+    except PyMongoError as e:
+        print("⚠️ Lỗi lấy bưu cục theo khung nhìn:", e)
         offices = []
     return jsonify(offices)
 
@@ -72,6 +102,7 @@ def postoffice_create():
             return redirect(url_for('postoffices.postoffices_page'))
 
         db.post_offices.insert_one(new_office)
+        after_office_write()
         flash("Thêm bưu cục thành công!", "success")
     except Exception as e:
         flash(f"Lỗi: {str(e)}", "danger")
@@ -96,6 +127,7 @@ def postoffice_update():
             {'_id': ObjectId(oid)},
             {'$set': updated_data}
         )
+        after_office_write()
         flash("Cập nhật thành công!", "success")
     except Exception as e:
         flash(f"Lỗi cập nhật: {str(e)}", "danger")
@@ -107,6 +139,7 @@ def postoffice_update():
 def postoffice_delete(oid):
     try:
         db.post_offices.delete_one({'_id': ObjectId(oid)})
+        after_office_write()
         flash("Đã xóa bưu cục", "success")
     except Exception as e:
         flash(f"Lỗi xóa: {str(e)}", "danger")
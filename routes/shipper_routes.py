@@ -1,5 +1,11 @@
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, render_template, jsonify, request
 from pymongo.errors import PyMongoError
+from services.cache import response_cache
+from services.http_cache import conditional
+from services import geo
+from services.locations import location_buffer
+from services.schemas import SHIPPER
+from services.shippers import shippers_with_office_pipeline
 
 db = None
 shipper_bp = Blueprint('shippers', __name__)
@@ -12,22 +18,7 @@ def init_mongo(mongo):
 @shipper_bp.route('/shippers')
 def shippers_page():
     try:
-        shps = list(db.shippers.aggregate([
-            {
-                '$lookup': {
-                    'from': 'post_offices',
-                    'localField': 'current_post_office_id',
-                    'foreignField': '_id',
-                    'as': 'post_office_info'
-                }
-            },
-            {
-                '$unwind': {
-                    'path': '$post_office_info',
-                    'preserveNullAndEmptyArrays': True
-                }
-            }
-        ]))
+        shps = list(db.shippers.aggregate(shippers_with_office_pipeline()))
     except PyMongoError as e:
         print("⚠️ Lỗi khi lấy shippers:", e)
         shps = []
@@ -35,25 +26,56 @@ def shippers_page():
 
 # API JSON để dùng AJAX/map
 @shipper_bp.route('/api/shippers/all')
+@conditional(lambda: db, 'shippers', 'post_offices')
+@response_cache.cached('shippers')
 def shippers_api():
     try:
-        shps = list(db.shippers.aggregate([
-            {
-                '$lookup': {
-                    'from': 'post_offices',
-                    'localField': 'current_post_office_id',
-                    'foreignField': '_id',
-                    'as': 'post_office_info'
-                }
-            },
-            {
-                '$unwind': {
-                    'path': '$post_office_info',
-                    'preserveNullAndEmptyArrays': True
-                }
-            }
-        ]))
+        shps = list(db.shippers.aggregate(shippers_with_office_pipeline(SHIPPER.projection)))
     except PyMongoError as e:
         print("⚠️ Lỗi API shippers:", e)
         shps = []
+    return jsonify(SHIPPER.dump_many(location_buffer.overlay(shps)))
+
+
+# API: k shipper đang hoạt động gần điểm lấy hàng nhất
+@shipper_bp.route('/api/shippers/nearest')
+def shippers_nearest():
+    try:
+        lng, lat = geo.parse_point(request.args.get('lat'), request.args.get('lng'))
+        k = min(max(int(request.args.get('k', 5)), 1), 100)
+        max_km = float(request.args['max_km']) if request.args.get('max_km') else None
+    except (geo.GeoQueryError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        if request.args.get('source') == 'memory':
+            shps = geo.nearest_shippers_memory(db, lng, lat, k, max_km)
+        else:
+            shps = geo.nearest_shippers(db, lng, lat, k, max_km)
+    except PyMongoError as e:
+        print("⚠️ Lỗi tìm shipper gần nhất:", e)
+        return jsonify({'error': 'database error'}), 500
     return jsonify(shps)
+
+# API: shipper trong khung nhìn bản đồ
+@shipper_bp.route('/api/shippers/viewport')
+def shippers_viewport():
+    try:
+        bbox = geo.parse_bbox(request.args.get('bbox'))
+    except geo.GeoQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        shps = geo.in_viewport(db.shippers, 'current_location', bbox, geo.SHIPPER_FIELDS)
+    except PyMongoError as e:
+        print("⚠️ Lỗi lấy shipper theo khung nhìn:", e)
+        shps = []
+    return jsonify(location_buffer.overlay(shps))
+
+# API: nhận ping GPS theo lô [{shipper_code, lat, lng, ts}], ghi xuống DB theo chu kỳ flush
+@shipper_bp.route('/api/shippers/locations', methods=['POST'])
+def shippers_locations():
+    data = request.get_json(silent=True)
+    pings = data.get('pings') if isinstance(data, dict) else data
+    if not isinstance(pings, list):
+        return jsonify({'error': 'body must be a list of pings or {"pings": [...]}'}), 400
+    accepted, rejected = location_buffer.ingest(pings)
+    return jsonify({'accepted': accepted, 'rejected': rejected}), 202
@@ -0,0 +1,175 @@
+import datetime
+import os
+from bson.objectid import ObjectId
+from pymongo import ReplaceOne, ReturnDocument
+from services import dashboard_stats
+from services.cache import invalidate_orders
+
+# Đơn kết thúc (không còn chuyển trạng thái được) hoặc đã xóa mềm, tạo trước N ngày thì chuyển sang *_archive
+TERMINAL_STATUSES = ['DELIVERED', 'CANCELLED']
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+DEFAULT_BATCH_SIZE = 1000
+ARCHIVE_SUFFIX = '_archive'
+STATE_ID = 'orders'
+
+
+def archive_name(collection):
+    return collection + ARCHIVE_SUFFIX
+
+
+def candidate_filter(cutoff):
+    """Mỗi nhánh $or dùng một index sẵn có: (current_status, created_at) và (is_deleted, created_at)"""
+    return {'$or': [
+        {'current_status': {'$in': TERMINAL_STATUSES}, 'created_at': {'$lt': cutoff}},
+        {'is_deleted': True, 'created_at': {'$lt': cutoff}},
+    ]}
+
+
+def _copy(db, collection, docs, now):
+    """Upsert theo _id: chạy lại cùng lô không tạo bản trùng"""
+    if docs:
+        db[archive_name(collection)].bulk_write(
+            [ReplaceOne({'_id': d['_id']}, dict(d, archived_at=now), upsert=True) for d in docs],
+            ordered=False
+        )
+
+
+def _checkpoint(db, fields):
+    db.archive_state.update_one({'_id': STATE_ID}, {'$set': fields})
+
+
+def _unarchive(db, order_ids):
+    """Đơn không còn thỏa điều kiện lưu trữ (bị cập nhật giữa chừng): trả shipments / transactions
+    đã chép về lại collection chính và bỏ các bản trong archive"""
+    for collection in ('shipments', 'transactions'):
+        docs = list(db[archive_name(collection)].find({'order_id': {'$in': order_ids}}))
+        if docs:
+            db[collection].bulk_write([
+                ReplaceOne({'_id': d['_id']}, {k: v for k, v in d.items() if k != 'archived_at'}, upsert=True)
+                for d in docs
+            ], ordered=False)
+        db[archive_name(collection)].delete_many({'order_id': {'$in': order_ids}})
+    db[archive_name('orders')].delete_many({'_id': {'$in': order_ids}})
+
+
+def _deltas(db, order_ids, kept):
+    """Lượng chuyển bộ đếm dashboard sang nhóm archived, tính trên bản trong archive: gồm cả đơn
+    đã bị xóa ở lần chạy trước bị ngắt"""
+    ids = [i for i in order_ids if i not in kept]
+    orders = db[archive_name('orders')].find({'_id': {'$in': ids}}, {'current_status': 1, 'is_deleted': 1})
+    return dashboard_stats.archived_deltas(orders)
+
+
+def move_batch(db, order_ids, cutoff, batch_id, now=None):
+    """Chép đơn + shipments + transactions sang archive rồi mới xóa bản gốc (đơn xóa cuối cùng).
+
+    Đơn được đọc lại và xóa với cùng điều kiện candidate_filter(cutoff): đơn đổi trạng thái / khôi phục
+    sau khi được chọn vào lô thì ở lại orders cùng shipments / transactions của nó.
+    Dừng giữa chừng ở bất kỳ bước nào thì chạy lại cùng danh sách _id là đủ: bản chép là upsert,
+    đơn còn ở orders thì vẫn được chọn lại. Lượng chuyển bộ đếm dashboard được lưu vào checkpoint
+    (pending_deltas) trước khi xóa và áp dụng một lần theo batch_id.
+    """
+    now = now or datetime.datetime.utcnow()
+    query = {'$and': [{'_id': {'$in': order_ids}}, candidate_filter(cutoff)]}
+    orders = list(db.orders.find(query))
+    ids = [o['_id'] for o in orders]
+    shipments = list(db.shipments.find({'order_id': {'$in': ids}})) if ids else []
+    transactions = list(db.transactions.find({'order_id': {'$in': ids}})) if ids else []
+
+    _copy(db, 'orders', orders, now)
+    _copy(db, 'shipments', shipments, now)
+    _copy(db, 'transactions', transactions, now)
+
+    kept = {d['_id'] for d in db.orders.find({'_id': {'$in': order_ids}, '$nor': [candidate_filter(cutoff)]}, {'_id': 1})}
+    if kept:
+        _unarchive(db, list(kept))
+    deltas = _deltas(db, order_ids, kept)
+    _checkpoint(db, {'pending_deltas': deltas})
+
+    if shipments:
+        db.shipments.delete_many({'_id': {'$in': [d['_id'] for d in shipments]}})
+    if transactions:
+        db.transactions.delete_many({'_id': {'$in': [d['_id'] for d in transactions]}})
+    removed = db.orders.delete_many(query).deleted_count if ids else 0
+
+    # Đơn bị cập nhật giữa lúc đọc lại và lúc xóa
+    late = {d['_id'] for d in db.orders.find({'_id': {'$in': ids}}, {'_id': 1})} if ids else set()
+    if late:
+        _unarchive(db, list(late))
+        deltas = _deltas(db, order_ids, kept | late)
+        _checkpoint(db, {'pending_deltas': deltas})
+
+    dashboard_stats.record_archived(db, deltas, batch_id)
+    invalidate_orders([o for o in orders if o['_id'] not in late])
+    return removed
+
+
+def _resume(db, state):
+    """Hoàn tất lô đang dở của lượt trước"""
+    pending = state['pending']
+    if state.get('pending_deltas') is not None and not db.orders.find_one(
+            {'$and': [{'_id': {'$in': pending}}, candidate_filter(state['cutoff'])]}, {'_id': 1}):
+        # Đã xóa xong: áp dụng lượng đã lưu (bỏ qua nếu lô này đã được áp dụng trước khi bị ngắt)
+        dashboard_stats.record_archived(db, state['pending_deltas'], state.get('pending_batch') or ObjectId())
+        return db[archive_name('orders')].count_documents({'_id': {'$in': pending}})
+    return move_batch(db, pending, state['cutoff'], state.get('pending_batch') or ObjectId())
+
+
+# --- CHẠY THEO LÔ, CÓ CHECKPOINT ---
+def run(db, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=DEFAULT_BATCH_SIZE, max_batches=None, log=print):
+    """Lưu trữ theo lô. Checkpoint ở archive_state: mốc cutoff của lượt chạy và lô đang dở.
+
+    Lượt trước chưa xong thì tiếp tục với cùng cutoff và làm lại lô đang dở trước.
+    Trả về document trạng thái cuối cùng.
+    """
+    state = db.archive_state.find_one({'_id': STATE_ID})
+    if not state or state.get('finished_at'):
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+        state = {'_id': STATE_ID, 'cutoff': cutoff, 'started_at': datetime.datetime.utcnow(),
+                 'finished_at': None, 'batches': 0, 'orders': 0, 'pending': None, 'pending_batch': None, 'pending_deltas': None}
+        db.archive_state.replace_one({'_id': STATE_ID}, state, upsert=True)
+    else:
+        log(f"⏳ Tiếp tục lượt lưu trữ từ {state['started_at']:%Y-%m-%d %H:%M} (cutoff {state['cutoff']:%Y-%m-%d})")
+
+    if state.get('pending'):
+        moved = _resume(db, state)
+        state = db.archive_state.find_one_and_update(
+            {'_id': STATE_ID}, {'$set': {'pending': None, 'pending_batch': None, 'pending_deltas': None},
+             '$inc': {'batches': 1, 'orders': moved}},
+            return_document=ReturnDocument.AFTER)
+
+    query = candidate_filter(state['cutoff'])
+    done = 0
+    while max_batches is None or done < max_batches:
+        # Đơn đã chuyển bị xóa khỏi orders nên mỗi lần chỉ cần lấy lô kế tiếp, không cần sort/skip
+        ids = [d['_id'] for d in db.orders.find(query, {'_id': 1}).limit(batch_size)]
+        if not ids:
+            state = db.archive_state.find_one_and_update(
+                {'_id': STATE_ID}, {'$set': {'finished_at': datetime.datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER)
+            break
+        batch_id = ObjectId()
+        db.archive_state.update_one({'_id': STATE_ID}, {'$set': {'pending': ids, 'pending_batch': batch_id}})
+        moved = move_batch(db, ids, state['cutoff'], batch_id)
+        state = db.archive_state.find_one_and_update(
+            {'_id': STATE_ID}, {'$set': {'pending': None, 'pending_batch': None, 'pending_deltas': None},
+             '$inc': {'batches': 1, 'orders': moved}},
+            return_document=ReturnDocument.AFTER)
+        done += 1
+        log(f"📦 Lô {state['batches']}: {moved} đơn (tổng {state['orders']})")
+    return state
+
+
+if __name__ == '__main__':
+    import argparse
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description='Chuyển đơn đã kết thúc / đã xóa sang *_archive')
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ViettelPost_DB'))
+    parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-batches', type=int, help='Dừng sau N lô (chạy lại để tiếp tục)')
+    args = parser.parse_args()
+
+    state = run(MongoClient(args.uri).get_default_database(), args.older_than_days, args.batch_size, args.max_batches)
+    print("✅ Hoàn tất" if state.get('finished_at') else "⏸️ Tạm dừng", f"- {state['orders']} đơn đã lưu trữ")
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from flask import request, Response
+from services.tracking import tracking_cache
+
+# TTL (giây) cho từng nhóm endpoint, ghi đè bằng biến môi trường CACHE_TTL_<NHÓM>
+TTLS = {
+    'postoffices': 300,
+    'shippers': 30,
+    'orders_summary': 10,
+    'cod': 30,
+}
+
+
+def ttl_for(namespace):
+    return int(os.environ.get(f'CACHE_TTL_{namespace.upper()}', TTLS.get(namespace, 30)))
+
+
+# --- BACKEND TRONG PROCESS: LRU giới hạn số phần tử + TTL ---
+class MemoryBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --- BACKEND REDIS: dùng chung giữa các worker ---
+class RedisBackend:
+    """Giới hạn bộ nhớ do Redis đảm nhận (maxmemory + allkeys-lru)"""
+
+    def __init__(self, client, prefix='viettelpost:cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=self.prefix + prefix + '*', count=500))
+        if keys:
+            self.client.delete(*keys)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + '*', count=500))
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def cached(self, namespace, ttl=None):
+        """Decorator cho view GET trả JSON: cache body theo path + query string"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+                key = f'{namespace}:{request.full_path}'
+                body = self.backend.get(key)
+                if body is not None:
+                    self.hits[namespace] += 1
+                    resp = Response(body, mimetype='application/json')
+                    resp.headers['X-Cache'] = 'HIT'
+                    return resp
+                self.misses[namespace] += 1
+                resp = view(*args, **kwargs)
+                if isinstance(resp, Response) and resp.status_code == 200 and resp.is_json:
+                    self.backend.set(key, resp.get_data(), ttl or ttl_for(namespace))
+                    resp.headers['X-Cache'] = 'MISS'
+                return resp
+            return wrapper
+        return decorator
+
+    def invalidate(self, *namespaces):
+        for ns in namespaces:
+            self.backend.delete_prefix(f'{ns}:')
+
+    def invalidate_path(self, namespace, path):
+        self.backend.delete_prefix(f'{namespace}:{path}')
+
+    def stats(self):
+        names = set(self.hits) | set(self.misses)
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'namespaces': {
+                ns: {
+                    'hits': self.hits[ns],
+                    'misses': self.misses[ns],
+                    'ttl': ttl_for(ns),
+                    'hit_ratio': round(self.hits[ns] / ((self.hits[ns] + self.misses[ns]) or 1), 4)
+                } for ns in sorted(names)
+            }
+        }
+
+
+response_cache = ResponseCache(MemoryBackend(int(os.environ.get('CACHE_MAX_ENTRIES', 1024))))
+
+
+def configure_cache():
+    """CACHE_BACKEND=redis dùng REDIS_URL, mặc định cache trong process"""
+    if os.environ.get('CACHE_BACKEND', 'memory').lower() == 'redis':
+        import redis
+        client = redis.Redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+        response_cache.backend = RedisBackend(client)
+    return response_cache
+
+
+# --- HÀM VÔ HIỆU HÓA DÙNG CHUNG CHO CÁC HANDLER GHI ---
+def invalidate_order(order_code=None, tracking_code=None):
+    """/track tra theo cả order_code lẫn tracking_code: xóa cache của cả hai mã (kể cả kết quả "không tìm thấy")"""
+    response_cache.invalidate('orders_summary')
+    codes = [c for c in (order_code, tracking_code) if c]
+    if codes:
+        tracking_cache.invalidate(*codes)
+
+
+def invalidate_orders(orders):
+    """Như invalidate_order cho cả lô đơn (document có order_code / tracking_code), xóa cache tổng hợp một lần"""
+    response_cache.invalidate('orders_summary')
+    codes = [o.get(k) for o in orders for k in ('order_code', 'tracking_code') if o.get(k)]
+    if codes:
+        tracking_cache.invalidate(*codes)
+
+
+def invalidate_postoffices():
+    # Danh sách shipper có kèm tên bưu cục nên cũng phải xóa
+    response_cache.invalidate('postoffices', 'shippers')
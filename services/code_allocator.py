@@ -0,0 +1,76 @@
+import datetime
+import os
+import threading
+from pymongo import ReturnDocument
+
+CODE_PREFIX = 'VT'
+
+
+def format_code(date_str, seq):
+    return f"{CODE_PREFIX}{date_str}{seq:04d}"
+
+
+def reserve_order_codes(db, n, now=None):
+    """Giữ chỗ n mã đơn liên tiếp bằng một lệnh $inc duy nhất trên counters"""
+    if n <= 0:
+        return []
+    date_str = (now or datetime.datetime.now()).strftime("%Y%m%d")
+    counter = db.counters.find_one_and_update(
+        {"_id": date_str},
+        {"$inc": {"seq": n}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    end = counter["seq"]
+    return [format_code(date_str, seq) for seq in range(end - n + 1, end + 1)]
+
+
+class OrderCodeAllocator:
+    """Cấp mã đơn từ các khối số thứ tự thuê trước (lease) cho mỗi process.
+
+    Mỗi lần hết khối chỉ cần một $inc lease_size trên counters nên document
+    counters không còn là điểm nóng. $inc là nguyên tử nên các process nhận
+    các khối rời nhau. Sang ngày mới thì khối cũ bị bỏ (chấp nhận khoảng trống).
+    """
+
+    def __init__(self, lease_size=20):
+        self.lease_size = max(1, int(lease_size))
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, date_str):
+        self._pid = os.getpid()
+        self._date = date_str
+        self._next = 1
+        self._end = 0
+        self._released = []
+
+    def _lease(self, db, date_str):
+        counter = db.counters.find_one_and_update(
+            {"_id": date_str},
+            {"$inc": {"seq": self.lease_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._end = counter["seq"]
+        self._next = self._end - self.lease_size + 1
+
+    def next_code(self, db, now=None):
+        date_str = (now or datetime.datetime.now()).strftime("%Y%m%d")
+        with self._lock:
+            # Process con sau fork hoặc sang ngày mới: bỏ khối đang giữ
+            if self._pid != os.getpid() or self._date != date_str:
+                self._reset(date_str)
+            if self._released:
+                return self._released.pop()
+            if self._next > self._end:
+                self._lease(db, date_str)
+            seq = self._next
+            self._next += 1
+        return format_code(date_str, seq)
+
+    def release(self, code):
+        """Trả lại mã chưa dùng (insert thất bại) để cấp lại trong process này"""
+        with self._lock:
+            if self._pid == os.getpid() and self._date and code.startswith(CODE_PREFIX + self._date):
+                self._released.append(code)
@@ -0,0 +1,49 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn, không có thì chỉ dùng gzip
+    brotli = None
+
+MIN_SIZE = 1024
+
+
+def _choose_encoding(accept):
+    accept = accept.lower()
+    if brotli is not None and 'br' in accept:
+        return 'br'
+    if 'gzip' in accept:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, accept_encoding, min_size=MIN_SIZE):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding(accept_encoding or '')
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=5)
+    else:
+        data = gzip.compress(data, compresslevel=5)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
+
+
+def init_compression(app, min_size=MIN_SIZE):
+    from flask import request
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, request.headers.get('Accept-Encoding'), min_size)
@@ -0,0 +1,296 @@
+import threading
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+# Số lượng tối đa khi đếm kết quả tìm kiếm tự do (vượt ngưỡng thì báo xấp xỉ)
+SEARCH_COUNT_CAP = 1000
+
+STATS_ID = 'orders'
+COD_ID = 'cod'
+COD_MATCH = {'transaction_type': 'COD_COLLECTION', 'status': 'COMPLETED'}
+# services/archive.py: đơn / giao dịch đã chuyển sang *_archive vẫn được tính vào số liệu tổng
+ORDERS_ARCHIVE = 'orders_archive'
+TRANSACTIONS_ARCHIVE = 'transactions_archive'
+# Số lần tính lại khi có $inc chen vào giữa lúc aggregate và lúc ghi kết quả dựng lại
+REBUILD_ATTEMPTS = 3
+
+
+def _key(status):
+    return status or 'UNKNOWN'
+
+
+def _inc(db, inc, doc_id=STATS_ID):
+    """Mọi lệnh $inc tăng kèm gen để lần dựng lại biết có lượt cộng dồn nào chen vào"""
+    inc = {k: v for k, v in inc.items() if v}
+    if inc:
+        db.dashboard_stats.update_one({'_id': doc_id}, {'$inc': dict(inc, gen=1)}, upsert=True)
+
+
+# --- DỰNG LẠI BỘ ĐẾM TỪ ĐẦU ---
+def compute_order_stats(db):
+    """live / deleted: đơn trong orders; archived: đơn trong orders_archive (mọi trạng thái xóa)"""
+    live, deleted, archived = {}, {}, {}
+    for row in db.orders.aggregate([
+        {'$group': {
+            '_id': {'s': '$current_status', 'd': {'$eq': ['$is_deleted', True]}},
+            'count': {'$sum': 1}
+        }}
+    ]):
+        bucket = deleted if row['_id'].get('d') else live
+        k = _key(row['_id'].get('s'))
+        bucket[k] = bucket.get(k, 0) + row['count']
+    for row in db[ORDERS_ARCHIVE].aggregate([{'$group': {'_id': '$current_status', 'count': {'$sum': 1}}}]):
+        k = _key(row['_id'])
+        archived[k] = archived.get(k, 0) + row['count']
+    return {'live': live, 'deleted': deleted, 'archived': archived}
+
+
+def compute_cod_stats(db):
+    """Tổng COD gồm cả giao dịch đã lưu trữ"""
+    total, count = 0.0, 0
+    for collection in ('transactions', TRANSACTIONS_ARCHIVE):
+        row = next(db[collection].aggregate([
+            {'$match': COD_MATCH},
+            {'$group': {'_id': None, 'total_cod': {'$sum': '$amount'}, 'count': {'$sum': 1}}}
+        ]), None) or {}
+        total += float(row.get('total_cod') or 0)
+        count += row.get('count', 0)
+    return {'total_cod': total, 'count': count}
+
+
+def _rebuild(db, doc_id, compute):
+    """Tính lại từ dữ liệu gốc rồi $set với điều kiện gen chưa đổi kể từ lúc đọc: có $inc chen vào
+    trong lúc aggregate thì tính lại thay vì ghi đè mất lượng vừa cộng.
+
+    Trả về (bản đã lưu trước đó, document sau khi ghi), document là None nếu cả REBUILD_ATTEMPTS lần
+    đều bị chen.
+    """
+    for _ in range(REBUILD_ATTEMPTS):
+        stored = db.dashboard_stats.find_one({'_id': doc_id}) or {}
+        values = compute(db)
+        gen = stored.get('gen')
+        try:
+            doc = db.dashboard_stats.find_one_and_update(
+                {'_id': doc_id, 'gen': gen if gen is not None else {'$exists': False}},
+                {'$set': values},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # gen đã đổi (hoặc document vừa được $inc tạo ra): upsert đụng _id đang có
+            continue
+        return stored, doc
+    return stored, None
+
+
+def rebuild_order_stats(db):
+    return _rebuild(db, STATS_ID, compute_order_stats)[1] or db.dashboard_stats.find_one({'_id': STATS_ID})
+
+
+def rebuild_cod_stats(db):
+    return _rebuild(db, COD_ID, compute_cod_stats)[1] or db.dashboard_stats.find_one({'_id': COD_ID})
+
+
+def get_order_stats(db):
+    stats = db.dashboard_stats.find_one({'_id': STATS_ID})
+    if stats is None:
+        stats = rebuild_order_stats(db)
+    return stats
+
+
+def get_cod_stats(db):
+    stats = db.dashboard_stats.find_one({'_id': COD_ID})
+    if stats is None:
+        stats = rebuild_cod_stats(db)
+    return stats
+
+
+def status_counts(stats):
+    """Gộp live + deleted + archived theo trạng thái (giống $group trên orders và orders_archive)"""
+    counts = {}
+    for bucket in (stats.get('live') or {}, stats.get('deleted') or {}, stats.get('archived') or {}):
+        for k, v in bucket.items():
+            counts[k] = counts.get(k, 0) + v
+    return [{'_id': k, 'count': v} for k, v in counts.items() if v > 0]
+
+
+def get_dashboard(db):
+    """Số liệu dashboard đọc từ dashboard_stats (O(1), không quét orders/transactions)"""
+    docs = {d['_id']: d for d in db.dashboard_stats.find({'_id': {'$in': [STATS_ID, COD_ID]}})}
+    orders = docs.get(STATS_ID) or rebuild_order_stats(db)
+    cod = docs.get(COD_ID) or rebuild_cod_stats(db)
+    by_status = sorted(status_counts(orders), key=lambda x: x['count'], reverse=True)
+    return {
+        'total_orders': sum(x['count'] for x in by_status),
+        'orders_by_status': by_status,
+        'cod_total': float(cod.get('total_cod') or 0)
+    }
+
+
+# --- CẬP NHẬT TĂNG DẦN KHI GHI ---
+def record_created(db, status, n=1):
+    _inc(db, {f'live.{_key(status)}': n})
+
+
+def record_status_change(db, old_status, new_status, deleted=False):
+    if old_status == new_status:
+        return
+    bucket = 'deleted' if deleted else 'live'
+    _inc(db, {f'{bucket}.{_key(old_status)}': -1, f'{bucket}.{_key(new_status)}': 1})
+
+
+def record_status_changes(db, changes, deleted=False):
+    """Gộp nhiều lần đổi trạng thái [(cũ, mới)] thành một lệnh $inc"""
+    bucket = 'deleted' if deleted else 'live'
+    inc = {}
+    for old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        for status, delta in ((old_status, -1), (new_status, 1)):
+            k = f'{bucket}.{_key(status)}'
+            inc[k] = inc.get(k, 0) + delta
+    _inc(db, inc)
+
+
+def record_deleted(db, status):
+    _inc(db, {f'live.{_key(status)}': -1, f'deleted.{_key(status)}': 1})
+
+
+def record_removed(db, status, deleted=False):
+    _inc(db, {f"{'deleted' if deleted else 'live'}.{_key(status)}": -1})
+
+
+def archived_deltas(orders):
+    """Đơn rời orders sang orders_archive (services/archive.py): chuyển từ live / deleted sang archived.
+
+    Tổng theo trạng thái và tổng COD không đổi. Trả về dict {key: delta} để lưu được vào checkpoint.
+    """
+    deltas = {}
+    for o in orders:
+        status = _key(o.get('current_status'))
+        for k, v in ((f"{'deleted' if o.get('is_deleted') is True else 'live'}.{status}", -1),
+                     (f'archived.{status}', 1)):
+            deltas[k] = deltas.get(k, 0) + v
+    return {k: v for k, v in deltas.items() if v}
+
+
+def record_archived(db, deltas, batch_id):
+    """Áp dụng deltas đúng một lần cho mỗi lô: batch_id được ghi cùng lệnh $inc, chạy lại cùng lô thì bỏ qua"""
+    if not deltas:
+        return False
+    res = db.dashboard_stats.update_one(
+        {'_id': STATS_ID, 'archive_batch': {'$ne': batch_id}},
+        {'$inc': dict(deltas, gen=1), '$set': {'archive_batch': batch_id}}
+    )
+    # Chưa có dashboard_stats: lần đọc đầu tiên dựng lại từ orders + orders_archive
+    return res.modified_count == 1
+
+
+def record_transactions(db, transactions):
+    cod = [t for t in transactions if all(t.get(k) == v for k, v in COD_MATCH.items())]
+    if cod:
+        _inc(db, {'total_cod': sum(float(t.get('amount') or 0) for t in cod), 'count': len(cod)}, COD_ID)
+
+
+def insert_transactions(db, transactions):
+    """Ghi giao dịch và cộng dồn tổng COD trong cùng đường ghi"""
+    if not transactions:
+        return None
+    result = db.transactions.insert_many(transactions)
+    record_transactions(db, transactions)
+    return result
+
+
+# --- ĐỐI SOÁT ĐỊNH KỲ ---
+def _diff(stored, actual):
+    drift = {}
+    for k in set(stored) | set(actual):
+        delta = (stored.get(k) or 0) - (actual.get(k) or 0)
+        if delta:
+            drift[k] = delta
+    return drift
+
+
+def reconcile(db):
+    """Dựng lại dashboard_stats từ dữ liệu gốc, trả về độ lệch (stored - actual).
+
+    Document bị $inc chen vào ở mọi lần thử thì giữ nguyên cho lượt sau, liệt kê trong 'skipped'.
+    """
+    drift, skipped = {}, []
+    old, orders = _rebuild(db, STATS_ID, compute_order_stats)
+    if orders is None:
+        skipped.append(STATS_ID)
+    else:
+        for bucket in ('live', 'deleted', 'archived'):
+            drift[bucket] = _diff(old.get(bucket) or {}, orders.get(bucket) or {})
+    old, cod = _rebuild(db, COD_ID, compute_cod_stats)
+    if cod is None:
+        skipped.append(COD_ID)
+    else:
+        drift['cod'] = _diff({k: old.get(k) for k in ('total_cod', 'count')},
+                             {k: cod.get(k) for k in ('total_cod', 'count')})
+    drift = {k: v for k, v in drift.items() if v}
+    if skipped:
+        drift['skipped'] = skipped
+    return drift
+
+
+def start_reconciler(db, interval):
+    """Chạy reconcile định kỳ trong thread nền, in ra nếu phát hiện lệch"""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                drift = reconcile(db)
+                skipped = drift.pop('skipped', None)
+                if drift:
+                    print("⚠️ dashboard_stats bị lệch, đã dựng lại:", drift)
+                if skipped:
+                    print("⚠️ dashboard_stats đang được ghi liên tục, để lượt sau đối soát:", skipped)
+            except PyMongoError as e:
+                print("⚠️ Lỗi đối soát dashboard_stats:", e)
+
+    threading.Thread(target=loop, name='dashboard-stats-reconciler', daemon=True).start()
+    return stop
+
+
+# --- ĐẾM TỔNG CHO PHÂN TRANG ---
+def count_orders(db, query, status=None, search=False, include_deleted=False, exact=False):
+    """Trả về (total, strategy, approximate) cho truy vấn danh sách đơn.
+
+    - không lọc: estimated_document_count (hoặc tổng bộ đếm nếu bỏ đơn đã xóa)
+    - chỉ lọc trạng thái: bộ đếm theo trạng thái
+    - tìm kiếm tự do: count có giới hạn SEARCH_COUNT_CAP, exact=True để đếm đủ
+    """
+    if search:
+        if exact:
+            return db.orders.count_documents(query), 'exact', False
+        total = db.orders.count_documents(query, limit=SEARCH_COUNT_CAP)
+        return total, 'capped', total >= SEARCH_COUNT_CAP
+
+    if not status and include_deleted:
+        return db.orders.estimated_document_count(), 'estimated', True
+
+    stats = get_order_stats(db)
+    buckets = [stats.get('live') or {}]
+    if include_deleted:
+        buckets.append(stats.get('deleted') or {})
+    if status:
+        total = sum(b.get(status, 0) for b in buckets)
+    else:
+        total = sum(sum(b.values()) for b in buckets)
+    return max(total, 0), 'status_counter', False
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description='Đối soát dashboard_stats với orders/transactions')
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ViettelPost_DB'))
+    args = parser.parse_args()
+
+    drift = reconcile(MongoClient(args.uri).get_default_database())
+    print("⚠️ Độ lệch đã sửa:" if drift else "✅ Không có độ lệch", drift or '')
@@ -0,0 +1,185 @@
+import datetime
+import queue
+import threading
+import time
+from pymongo.errors import OperationFailure, PyMongoError
+
+# Sự kiện phát cho client: ('order_status' | 'notification' | 'resync', payload)
+ORDER_FIELDS = {'order_code': 1, 'current_status': 1, 'updated_at': 1}
+NOTIFICATION_FIELDS = {'user_id': 1, 'type': 1, 'order_code': 1, 'message': 1, 'timestamp': 1}
+
+# Change stream: chỉ đơn đổi trạng thái và notification mới
+CHANGE_PIPELINE = [{'$match': {'$or': [
+    {'ns.coll': 'orders', 'operationType': 'update',
+     'updateDescription.updatedFields.current_status': {'$exists': True}},
+    {'ns.coll': 'orders', 'operationType': {'$in': ['insert', 'replace']}},
+    {'ns.coll': 'notifications', 'operationType': 'insert'},
+]}}]
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def order_event(doc):
+    return 'order_status', {
+        'order_id': str(doc['_id']),
+        'order_code': doc.get('order_code'),
+        'status': doc.get('current_status'),
+        'updated_at': _iso(doc.get('updated_at')),
+    }
+
+
+def notification_event(doc):
+    return 'notification', {
+        'id': str(doc['_id']),
+        'user_id': doc.get('user_id'),
+        'type': doc.get('type'),
+        'order_code': doc.get('order_code'),
+        'message': doc.get('message'),
+        'timestamp': _iso(doc.get('timestamp')),
+    }
+
+
+class Subscription:
+    def __init__(self, kinds=None, user_id=None, maxsize=100):
+        self.kinds = set(kinds) if kinds else None
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize)
+
+    def wants(self, kind, payload):
+        if self.kinds and kind not in self.kinds:
+            return False
+        if kind == 'notification' and self.user_id and payload.get('user_id') != self.user_id:
+            return False
+        return True
+
+    def push(self, kind, payload):
+        try:
+            self.queue.put_nowait((kind, payload))
+        except queue.Full:
+            # Client đọc chậm: bỏ hàng đợi cũ, báo client tải lại trạng thái thay vì giữ bộ nhớ vô hạn
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(('resync', {}))
+
+
+class EventHub:
+    """Một watcher duy nhất (change stream hoặc polling) phát sự kiện cho mọi client SSE.
+
+    Watcher chạy khi có ít nhất một client và tự dừng khi client cuối cùng ngắt kết nối.
+    """
+
+    def __init__(self, client_queue_size=100, poll_interval=1.0):
+        self.client_queue_size = client_queue_size
+        self.poll_interval = poll_interval
+        self.mode = None
+        self._db = None
+        self._lock = threading.Lock()
+        self._subs = set()
+        self._thread = None
+
+    def init(self, db):
+        self._db = db
+
+    # --- ĐĂNG KÝ CLIENT ---
+    def subscribe(self, kinds=None, user_id=None):
+        sub = Subscription(kinds, user_id, self.client_queue_size)
+        with self._lock:
+            self._subs.add(sub)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='event-hub', daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def clients(self):
+        return len(self._subs)
+
+    def broadcast(self, kind, payload):
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            if sub.wants(kind, payload):
+                sub.push(kind, payload)
+
+    def _active(self):
+        with self._lock:
+            if not self._subs:
+                self._thread = None
+                return False
+            return True
+
+    # --- WATCHER ---
+    def _run(self):
+        try:
+            self._watch_changes()
+        except OperationFailure as e:
+            # Standalone mongod không hỗ trợ change stream: chuyển sang polling
+            print("⚠️ Change stream không khả dụng, dùng polling:", e)
+            self._poll()
+        except PyMongoError as e:
+            print("⚠️ Lỗi event hub:", e)
+            with self._lock:
+                self._thread = None
+
+    def _watch_changes(self):
+        self.mode = 'change_stream'
+        resume_token = None
+        while self._active():
+            try:
+                with self._db.watch(CHANGE_PIPELINE, full_document='updateLookup',
+                                    resume_after=resume_token, max_await_time_ms=1000) as stream:
+                    while stream.alive and self._active():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        doc = change.get('fullDocument')
+                        if not doc:
+                            continue
+                        if change['ns']['coll'] == 'orders':
+                            self.broadcast(*order_event(doc))
+                        else:
+                            self.broadcast(*notification_event(doc))
+            except OperationFailure:
+                if resume_token is None:
+                    raise
+                # Token hết hạn trong oplog: báo client tải lại rồi xem tiếp từ hiện tại
+                resume_token = None
+                self.broadcast('resync', {})
+
+    def _poll(self):
+        self.mode = 'polling'
+        db = self._db
+        since = datetime.datetime.utcnow()
+        seen_at_since = set()
+        last_notif = db.notifications.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+        last_notif_id = last_notif['_id'] if last_notif else None
+        while self._active():
+            try:
+                # updated_at có thể trùng nhau: lấy >= since và bỏ các đơn đã phát tại đúng mốc since
+                for doc in db.orders.find({'updated_at': {'$gte': since}}, ORDER_FIELDS).sort('updated_at', 1):
+                    if doc['updated_at'] == since and doc['_id'] in seen_at_since:
+                        continue
+                    if doc['updated_at'] > since:
+                        since, seen_at_since = doc['updated_at'], set()
+                    seen_at_since.add(doc['_id'])
+                    self.broadcast(*order_event(doc))
+
+                query = {'_id': {'$gt': last_notif_id}} if last_notif_id else {}
+                for doc in db.notifications.find(query, NOTIFICATION_FIELDS).sort('_id', 1).limit(1000):
+                    last_notif_id = doc['_id']
+                    self.broadcast(*notification_event(doc))
+            except PyMongoError as e:
+                print("⚠️ Lỗi polling sự kiện:", e)
+            time.sleep(self.poll_interval)
+
+
+event_hub = EventHub()
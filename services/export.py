@@ -0,0 +1,203 @@
+import csv
+import datetime
+import io
+import os
+from bson.decimal128 import Decimal128
+from services.archive import ARCHIVE_SUFFIX
+from services.serialization import Schema, dumps_bytes
+
+DEFAULT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+MAX_BATCH_SIZE = 10000
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_SORT = [('created_at', 1), ('_id', 1)]
+
+
+class ExportError(ValueError):
+    pass
+
+
+# --- CỘT XUẤT: tên cột đơn hàng trùng tên field của /api/orders/import để nhập lại được ---
+ORDER_EXPORT = Schema(
+    'order_code', 'current_status', 'created_at', 'updated_at',
+    ('sender_name', 'sender_info.name'), ('sender_phone', 'sender_info.phone'),
+    ('recipient_name', 'recipient_info.name'), ('recipient_phone', 'recipient_info.phone'),
+    ('recipient_address', 'recipient_info.address'),
+    ('weight', 'parcel.weight'), ('contents', 'parcel.contents'), ('declared_value', 'parcel.declared_value'),
+    ('cod_amount', 'financials.cod_amount'), ('shipping_fee', 'financials.shipping_fee'),
+    ('insurance_fee', 'financials.insurance_fee'), ('total_amount', 'financials.total_amount'),
+)
+
+TRANSACTION_EXPORT = Schema(
+    'transaction_code', 'order_id', 'transaction_type', 'amount', 'currency', 'status', 'created_at',
+)
+
+
+class Export:
+    def __init__(self, collection, schema, status_field, amount_field, exclude_deleted=False):
+        self.collection = collection
+        self.schema = schema
+        self.status_field = status_field
+        self.amount_field = amount_field
+        self.exclude_deleted = exclude_deleted
+
+
+EXPORTS = {
+    'orders': Export('orders', ORDER_EXPORT, 'current_status', 'financials.cod_amount', exclude_deleted=True),
+    'transactions': Export('transactions', TRANSACTION_EXPORT, 'status', 'amount'),
+}
+
+
+# --- PARSE BỘ LỌC ---
+def _parse_date(value, name, end=False):
+    try:
+        dt = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f'{name} must be YYYY-MM-DD or an ISO datetime')
+    # date_to=YYYY-MM-DD lấy trọn ngày đó
+    if end and len(value) == 10:
+        dt += datetime.timedelta(days=1)
+    return dt
+
+
+def _parse_amount(value, name):
+    try:
+        return float(value)
+    except ValueError:
+        raise ExportError(f'{name} must be a number')
+
+
+def build_filter(kind, args):
+    """args: request.args hoặc dict; status (nhiều giá trị cách nhau dấu phẩy), date_from, date_to,
+    cod_min, cod_max (đơn: financials.cod_amount, giao dịch: amount), include_deleted"""
+    if kind not in EXPORTS:
+        raise ExportError(f'kind must be one of {", ".join(EXPORTS)}')
+    spec = EXPORTS[kind]
+    query = {}
+
+    statuses = [s.strip() for s in (args.get('status') or '').split(',') if s.strip()]
+    if len(statuses) == 1:
+        query[spec.status_field] = statuses[0]
+    elif statuses:
+        query[spec.status_field] = {'$in': statuses}
+
+    created = {}
+    if args.get('date_from'):
+        created['$gte'] = _parse_date(args['date_from'], 'date_from')
+    if args.get('date_to'):
+        created['$lt'] = _parse_date(args['date_to'], 'date_to', end=True)
+    if created:
+        query['created_at'] = created
+
+    amount = {}
+    if args.get('cod_min') not in (None, ''):
+        amount['$gte'] = _parse_amount(args['cod_min'], 'cod_min')
+    if args.get('cod_max') not in (None, ''):
+        amount['$lte'] = _parse_amount(args['cod_max'], 'cod_max')
+    if amount:
+        query[spec.amount_field] = amount
+
+    if spec.exclude_deleted and str(args.get('include_deleted', '')).lower() not in ('1', 'true'):
+        query['is_deleted'] = {'$ne': True}
+    return query
+
+
+def parse_batch_size(value):
+    try:
+        batch_size = int(value or DEFAULT_BATCH_SIZE)
+    except ValueError:
+        raise ExportError('batch_size must be an integer')
+    return min(max(batch_size, 1), MAX_BATCH_SIZE)
+
+
+# --- ĐỌC + GHI THEO LÔ ---
+def iter_docs(db, kind, query, batch_size=DEFAULT_BATCH_SIZE, archived=False):
+    """Duyệt cursor theo created_at tăng dần; driver chỉ giữ một batch trong bộ nhớ"""
+    spec = EXPORTS[kind]
+    collection = spec.collection + ARCHIVE_SUFFIX if archived else spec.collection
+    cursor = db[collection].find(query, spec.schema.projection, batch_size=batch_size).sort(EXPORT_SORT)
+    try:
+        for doc in cursor:
+            yield spec.schema.dump(doc)
+    finally:
+        cursor.close()
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    return value
+
+
+def iter_ndjson(rows, batch_size=DEFAULT_BATCH_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(dumps_bytes(row))
+        if len(chunk) >= batch_size:
+            yield b'\n'.join(chunk) + b'\n'
+            chunk = []
+    if chunk:
+        yield b'\n'.join(chunk) + b'\n'
+
+
+def iter_csv(rows, columns, batch_size=DEFAULT_BATCH_SIZE):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # BOM để Excel nhận đúng UTF-8 (tên tiếng Việt)
+    buf.write('\ufeff')
+    writer.writerow(columns)
+    n = 0
+    for row in rows:
+        writer.writerow([_csv_value(row.get(c)) for c in columns])
+        n += 1
+        if n % batch_size == 0:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode('utf-8')
+
+
+def stream(db, kind, fmt, query, batch_size=DEFAULT_BATCH_SIZE, archived=False):
+    """Generator bytes của file xuất; mỗi lần yield tối đa một batch dòng.
+    archived=True: đọc từ orders_archive / transactions_archive (services/archive.py)"""
+    rows = iter_docs(db, kind, query, batch_size, archived)
+    if fmt == 'csv':
+        return iter_csv(rows, EXPORTS[kind].schema.columns, batch_size)
+    return iter_ndjson(rows, batch_size)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description='Xuất đơn hàng / giao dịch COD ra NDJSON hoặc CSV')
+    parser.add_argument('kind', choices=sorted(EXPORTS))
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ViettelPost_DB'))
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument('--status', help='Một hoặc nhiều trạng thái, cách nhau dấu phẩy')
+    parser.add_argument('--date-from', help='YYYY-MM-DD hoặc ISO datetime (created_at >=)')
+    parser.add_argument('--date-to', help='YYYY-MM-DD (lấy trọn ngày) hoặc ISO datetime (created_at <)')
+    parser.add_argument('--cod-min', help='COD (đơn) / amount (giao dịch) tối thiểu')
+    parser.add_argument('--cod-max', help='COD (đơn) / amount (giao dịch) tối đa')
+    parser.add_argument('--include-deleted', action='store_true', help='Kèm đơn đã xóa mềm')
+    parser.add_argument('--archived', action='store_true', help='Xuất từ dữ liệu đã lưu trữ (*_archive)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('-o', '--output', help='File đích (mặc định stdout)')
+    args = parser.parse_args()
+
+    try:
+        query = build_filter(args.kind, {k: v for k, v in vars(args).items() if v is not None})
+    except ExportError as e:
+        parser.error(str(e))
+    db = MongoClient(args.uri).get_default_database()
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream(db, args.kind, args.format, query, parse_batch_size(args.batch_size), args.archived):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
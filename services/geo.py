@@ -0,0 +1,235 @@
+import math
+import threading
+from services.shippers import ACTIVE_STATUSES
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_RESULTS = 2000
+
+
+class GeoQueryError(ValueError):
+    pass
+
+
+# --- PARSE THAM SỐ ---
+def parse_point(lat, lng):
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise GeoQueryError('lat and lng are required numbers')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise GeoQueryError('lat/lng out of range')
+    return lng, lat
+
+
+def parse_bbox(value):
+    """bbox=minLng,minLat,maxLng,maxLat (thứ tự giống Leaflet map.getBounds().toBBoxString())"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = [float(x) for x in (value or '').split(',')]
+    except ValueError:
+        raise GeoQueryError('bbox must be minLng,minLat,maxLng,maxLat')
+    if min_lng >= max_lng or min_lat >= max_lat:
+        raise GeoQueryError('bbox is empty')
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def bbox_polygon(bbox):
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return {'type': 'Polygon', 'coordinates': [[
+        [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]
+    ]]}
+
+
+def haversine_km(lng1, lat1, lng2, lat2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _clean(docs):
+    for d in docs:
+        for k in ('_id', 'current_post_office_id'):
+            if d.get(k) is not None:
+                d[k] = str(d[k])
+        if 'distance_m' in d:
+            d['distance_km'] = round(d.pop('distance_m') / 1000, 3)
+    return docs
+
+
+# --- TRUY VẤN MONGODB ($geoNear / $geoWithin) ---
+SHIPPER_FIELDS = {'shipper_code': 1, 'full_name': 1, 'phone_number': 1, 'status': 1,
+                  'current_location': 1, 'current_post_office_id': 1}
+OFFICE_FIELDS = {'office_code': 1, 'name': 1, 'address': 1, 'location': 1,
+                 'operating_hours': 1, 'phone_number': 1}
+
+
+def nearest_shippers_pipeline(lng, lat, k=5, max_km=None):
+    geo_near = {
+        'near': {'type': 'Point', 'coordinates': [lng, lat]},
+        'key': 'current_location',
+        'distanceField': 'distance_m',
+        'spherical': True,
+        'query': {'status': {'$in': ACTIVE_STATUSES}}
+    }
+    if max_km:
+        geo_near['maxDistance'] = max_km * 1000
+    return [
+        {'$geoNear': geo_near},
+        {'$limit': k},
+        {'$project': dict(SHIPPER_FIELDS, distance_m=1)}
+    ]
+
+
+def nearest_shippers(db, lng, lat, k=5, max_km=None):
+    return _clean(list(db.shippers.aggregate(nearest_shippers_pipeline(lng, lat, k, max_km))))
+
+
+def post_offices_within_pipeline(lng, lat, km, limit=MAX_RESULTS):
+    return [
+        {'$geoNear': {
+            'near': {'type': 'Point', 'coordinates': [lng, lat]},
+            'key': 'location',
+            'distanceField': 'distance_m',
+            'spherical': True,
+            'maxDistance': km * 1000
+        }},
+        {'$limit': limit},
+        {'$project': dict(OFFICE_FIELDS, distance_m=1)}
+    ]
+
+
+def post_offices_within(db, lng, lat, km, limit=MAX_RESULTS):
+    return _clean(list(db.post_offices.aggregate(post_offices_within_pipeline(lng, lat, km, limit))))
+
+
+def viewport_filter(field, bbox, query=None):
+    q = dict(query or {})
+    q[field] = {'$geoWithin': {'$geometry': bbox_polygon(bbox)}}
+    return q
+
+
+def in_viewport(collection, field, bbox, projection, query=None, limit=MAX_RESULTS):
+    return _clean(list(collection.find(viewport_filter(field, bbox, query), projection).limit(limit)))
+
+
+# --- INDEX LƯỚI TRONG PROCESS CHO VỊ TRÍ SHIPPER ---
+class GridIndex:
+    """Lưới ô vuông cell_deg độ: tra k điểm gần nhất bằng cách mở rộng vòng ô quanh điểm cần tìm"""
+
+    def __init__(self, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self._lock = threading.RLock()
+        self._cells = {}
+        self._items = {}
+        # Biên các ô đã từng có điểm (chỉ mở rộng), giới hạn số vòng cần quét
+        self._bounds = None
+        self.loaded = False
+
+    def _cell(self, lng, lat):
+        return int(math.floor(lng / self.cell_deg)), int(math.floor(lat / self.cell_deg))
+
+    def upsert(self, key, lng, lat, data=None):
+        with self._lock:
+            self.remove(key)
+            cell = self._cell(lng, lat)
+            self._items[key] = (lng, lat, cell, data or {})
+            self._cells.setdefault(cell, set()).add(key)
+            if self._bounds is None:
+                self._bounds = [cell[0], cell[1], cell[0], cell[1]]
+            else:
+                b = self._bounds
+                self._bounds = [min(b[0], cell[0]), min(b[1], cell[1]), max(b[2], cell[0]), max(b[3], cell[1])]
+
+    def remove(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item:
+                members = self._cells.get(item[2])
+                members.discard(key)
+                if not members:
+                    del self._cells[item[2]]
+
+    def get(self, key):
+        item = self._items.get(key)
+        return (item[0], item[1], item[3]) if item else None
+
+    def __len__(self):
+        return len(self._items)
+
+    def _ring_cells(self, cx, cy, ring):
+        """Các ô trên viền vòng thứ ring quanh (cx, cy), chỉ lấy phần giao với biên dữ liệu"""
+        min_x, min_y, max_x, max_y = self._bounds
+        if ring == 0:
+            yield cx, cy
+            return
+        x_lo, x_hi = max(cx - ring, min_x), min(cx + ring, max_x)
+        for y in (cy - ring, cy + ring):
+            if min_y <= y <= max_y:
+                for x in range(x_lo, x_hi + 1):
+                    yield x, y
+        y_lo, y_hi = max(cy - ring + 1, min_y), min(cy + ring - 1, max_y)
+        for x in (cx - ring, cx + ring):
+            if min_x <= x <= max_x:
+                for y in range(y_lo, y_hi + 1):
+                    yield x, y
+
+    def nearest(self, lng, lat, k=5, max_km=None, predicate=None):
+        cx, cy = self._cell(lng, lat)
+        # Độ dài 1 ô theo km (theo vĩ độ, là cận dưới an toàn cho cả hai trục)
+        cell_km = self.cell_deg * 111.32 * max(math.cos(math.radians(min(abs(lat) + self.cell_deg, 89.9))), 0.01)
+        found, seen = [], 0
+        with self._lock:
+            if not self._items:
+                return []
+            min_x, min_y, max_x, max_y = self._bounds
+            max_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy, 0)
+            if max_km:
+                max_ring = min(max_ring, int(max_km / cell_km) + 1)
+            ring = 0
+            while ring <= max_ring:
+                for x, y in self._ring_cells(cx, cy, ring):
+                    for key in self._cells.get((x, y), ()):
+                        seen += 1
+                        p_lng, p_lat, _, data = self._items[key]
+                        if predicate and not predicate(data):
+                            continue
+                        d = haversine_km(lng, lat, p_lng, p_lat)
+                        if max_km is None or d <= max_km:
+                            found.append((d, key, p_lng, p_lat, data))
+                found.sort(key=lambda x: x[0])
+                # Các ô ở vòng tiếp theo cách ít nhất ring * cell_km: dừng khi đủ k điểm gần hơn
+                if len(found) >= k and found[k - 1][0] <= ring * cell_km:
+                    break
+                if seen == len(self._items):
+                    break
+                ring += 1
+        return [dict(data, distance_km=round(d, 3), current_location={'type': 'Point', 'coordinates': [p_lng, p_lat]})
+                for d, key, p_lng, p_lat, data in found[:k]]
+
+    def load(self, docs, key_field, location_field, fields):
+        with self._lock:
+            self._cells.clear()
+            self._items.clear()
+            self._bounds = None
+            for d in docs:
+                coords = (d.get(location_field) or {}).get('coordinates')
+                if d.get(key_field) and coords and len(coords) == 2:
+                    self.upsert(d[key_field], coords[0], coords[1], {f: d.get(f) for f in fields})
+            self.loaded = True
+
+
+shipper_grid = GridIndex()
+
+
+def ensure_shipper_grid(db):
+    """Nạp vị trí shipper vào lưới lần đầu cần dùng"""
+    if not shipper_grid.loaded:
+        fields = ['shipper_code', 'full_name', 'phone_number', 'status']
+        docs = db.shippers.find({'current_location': {'$exists': True}}, dict.fromkeys(fields + ['current_location'], 1))
+        shipper_grid.load(docs, 'shipper_code', 'current_location', fields)
+    return shipper_grid
+
+
+def nearest_shippers_memory(db, lng, lat, k=5, max_km=None):
+    grid = ensure_shipper_grid(db)
+    return grid.nearest(lng, lat, k, max_km, predicate=lambda d: d.get('status') in ACTIVE_STATUSES)
@@ -0,0 +1,61 @@
+import hashlib
+from functools import wraps
+from flask import request, Response
+
+# Hậu tố ETag theo Content-Encoding (ETag mạnh phải khác nhau giữa các bản mã hóa)
+ENCODING_SUFFIXES = ('-gzip', '-br')
+
+
+# --- BỘ ĐẾM PHIÊN BẢN COLLECTION ---
+def bump_version(db, *names):
+    for name in names:
+        db.collection_versions.update_one({'_id': name}, {'$inc': {'v': 1}}, upsert=True)
+
+
+def get_versions(db, names):
+    found = {d['_id']: d.get('v', 0) for d in db.collection_versions.find({'_id': {'$in': list(names)}})}
+    return [found.get(n, 0) for n in names]
+
+
+def make_etag(names, versions, path):
+    raw = '|'.join(f'{n}:{v}' for n, v in zip(names, versions)) + '|' + path
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def _client_etags():
+    header = request.headers.get('If-None-Match', '')
+    tags = set()
+    for part in header.split(','):
+        tag = part.strip()
+        if tag == '*':
+            tags.add('*')
+            continue
+        tag = tag.strip('"')
+        for suffix in ENCODING_SUFFIXES:
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)]
+        if tag:
+            tags.add(tag)
+    return tags
+
+
+def conditional(get_db, *names):
+    """Decorator: ETag từ phiên bản collection, trả 304 mà không chạy view.
+
+    get_db là hàm trả về db hiện tại (db của blueprint được gán sau khi import).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = make_etag(names, get_versions(get_db(), names), request.full_path)
+            client_tags = _client_etags()
+            if etag in client_tags or '*' in client_tags:
+                resp = Response(status=304)
+                resp.set_etag(etag)
+                return resp
+            resp = view(*args, **kwargs)
+            if isinstance(resp, Response) and resp.status_code == 200:
+                resp.set_etag(etag)
+            return resp
+        return wrapper
+    return decorator
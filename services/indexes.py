@@ -0,0 +1,173 @@
+import os
+import threading
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT, IndexModel
+from pymongo.errors import PyMongoError
+
+# --- DANH SÁCH INDEX ỨNG DỤNG CẦN ---
+# Mỗi index ghi chú truy vấn (route) sử dụng nó; tên trùng tên mặc định của MongoDB
+# để không xung đột với các index đã tạo thủ công bởi importdata.
+INDEXES = {
+    'orders': [
+        # /track, /api/track/<code>, kiểm tra trùng mã khi tạo/import đơn
+        IndexModel([('order_code', ASCENDING)], name='order_code_1', unique=True),
+        # /api/orders (api_bp), dashboard "10 đơn gần nhất": sort (created_at, _id) + keyset seek
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='created_at_-1__id_-1'),
+        # /api/orders?status=...: lọc trạng thái + sort created_at
+        IndexModel([('current_status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='current_status_1_created_at_-1__id_-1'),
+        # /api/orders (order_bp): bỏ đơn đã xóa mềm + sort created_at
+        IndexModel([('is_deleted', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='is_deleted_1_created_at_-1__id_-1'),
+        # /api/events khi không có change stream (mongod standalone): polling theo updated_at
+        IndexModel([('updated_at', ASCENDING)], name='updated_at_1'),
+        # Tìm kiếm đơn: tiền tố mã đơn / số điện thoại và text index trên tên đã chuẩn hóa
+        IndexModel([('search_keys.code', ASCENDING)], name='search_keys.code_1'),
+        IndexModel([('search_keys.phone', ASCENDING)], name='search_keys.phone_1'),
+        IndexModel([('search_keys.name', TEXT)], name='search_keys.name_text', default_language='none'),
+    ],
+    'shipments': [
+        # /track, /api/track/<code>
+        IndexModel([('tracking_code', ASCENDING)], name='tracking_code_1'),
+        # Ghi lịch sử trạng thái theo đơn
+        IndexModel([('order_id', ASCENDING)], name='order_id_1'),
+    ],
+    'transactions': [
+        # Tổng COD (đối soát dashboard_stats)
+        IndexModel([('transaction_type', ASCENDING), ('status', ASCENDING)], name='transaction_type_1_status_1'),
+        IndexModel([('order_id', ASCENDING)], name='order_id_1'),
+        # /api/export/transactions: lọc khoảng ngày + sort created_at
+        IndexModel([('created_at', ASCENDING)], name='created_at_1'),
+    ],
+    # Dữ liệu đã lưu trữ (services/archive.py): chỉ phục vụ tra cứu vận đơn và đối soát COD
+    'orders_archive': [
+        IndexModel([('order_code', ASCENDING)], name='order_code_1'),
+    ],
+    'shipments_archive': [
+        IndexModel([('tracking_code', ASCENDING)], name='tracking_code_1'),
+        IndexModel([('order_id', ASCENDING)], name='order_id_1'),
+    ],
+    'transactions_archive': [
+        IndexModel([('transaction_type', ASCENDING), ('status', ASCENDING)], name='transaction_type_1_status_1'),
+        IndexModel([('order_id', ASCENDING)], name='order_id_1'),
+    ],
+    'notifications': [
+        # Hộp thư /api/notifications/<user>: lọc user + trạng thái đọc, sort timestamp + keyset
+        IndexModel([('user_id', ASCENDING), ('is_read', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)],
+                   name='user_id_1_is_read_1_timestamp_-1__id_-1'),
+        # Tự xóa notification đã đọc sau NOTIFICATION_TTL_DAYS ngày (chưa đọc thì giữ để bộ đếm khớp)
+        IndexModel([('read_at', ASCENDING)], name='read_at_1',
+                   expireAfterSeconds=int(os.environ.get('NOTIFICATION_TTL_DAYS', 30)) * 86400,
+                   partialFilterExpression={'is_read': True}),
+    ],
+    'post_offices': [
+        # Kiểm tra trùng mã khi tạo bưu cục
+        IndexModel([('office_code', ASCENDING)], name='office_code_1', unique=True),
+        IndexModel([('location', GEOSPHERE)], name='location_2dsphere'),
+    ],
+    'shippers': [
+        # /api/shippers/active
+        IndexModel([('status', ASCENDING)], name='status_1'),
+        IndexModel([('shipper_code', ASCENDING)], name='shipper_code_1', unique=True),
+        IndexModel([('current_location', GEOSPHERE)], name='current_location_2dsphere'),
+    ],
+}
+
+
+def _key(spec):
+    return tuple((k, v) for k, v in spec.items()) if isinstance(spec, dict) else tuple(spec)
+
+
+def ensure_indexes(db):
+    """Tạo các index còn thiếu (idempotent), trả về (đã đảm bảo, lỗi)"""
+    ensured, errors = [], []
+    for coll_name, models in INDEXES.items():
+        for model in models:
+            # Tạo từng index để một index lỗi (vd. dữ liệu trùng với unique) không chặn các index khác
+            try:
+                ensured.extend(db[coll_name].create_indexes([model]))
+            except PyMongoError as e:
+                errors.append((coll_name, model.document['name'], str(e)))
+                print(f"⚠️ Lỗi tạo index {coll_name}.{model.document['name']}:", e)
+    return ensured, errors
+
+
+def ensure_indexes_async(db):
+    """Kiểm tra/tạo index trong thread nền để không chặn app khởi động"""
+    def run():
+        ensured, errors = ensure_indexes(db)
+        print(f"✅ Đã kiểm tra {len(ensured)} index" + (f", {len(errors)} lỗi" if errors else ""))
+
+    thread = threading.Thread(target=run, name='ensure-indexes', daemon=True)
+    thread.start()
+    return thread
+
+
+# --- BÁO CÁO INDEX: THIẾU / KHÔNG DÙNG / DƯ THỪA ---
+def index_report(db):
+    report = {}
+    for coll_name, models in INDEXES.items():
+        coll = db[coll_name]
+        existing = coll.index_information()
+        existing_keys = {name: _key(info['key']) for name, info in existing.items()}
+        wanted = {m.document['name']: _key(m.document['key']) for m in models}
+
+        try:
+            usage = {s['name']: s['accesses'] for s in coll.aggregate([{'$indexStats': {}}])}
+        except PyMongoError:
+            usage = {}
+
+        # Text index được lưu dưới khóa _fts/_ftsx nên so thêm theo tên
+        missing = [name for name, key in wanted.items() if key not in existing_keys.values() and name not in existing]
+        unused = [
+            {'name': name, 'since': str(usage[name].get('since'))}
+            for name in existing if name != '_id_' and name in usage and usage[name].get('ops', 0) == 0
+        ]
+        redundant = []
+        for name, key in existing_keys.items():
+            info = existing[name]
+            if name == '_id_' or info.get('unique') or info.get('partialFilterExpression') \
+                    or 'expireAfterSeconds' in info or any(not isinstance(v, int) for _, v in key):
+                continue
+            for other, other_key in existing_keys.items():
+                if other != name and len(other_key) > len(key) and other_key[:len(key)] == key:
+                    redundant.append({'name': name, 'covered_by': other})
+                    break
+
+        report[coll_name] = {
+            'missing': missing,
+            'unused': unused,
+            'redundant': redundant,
+            'unregistered': [n for n, k in existing_keys.items()
+                             if n != '_id_' and n not in wanted and k not in wanted.values()],
+            'ops': {name: usage[name].get('ops', 0) for name in usage},
+        }
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import os
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description='Quản lý index theo registry INDEXES')
+    parser.add_argument('command', choices=['report', 'ensure'])
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ViettelPost_DB'))
+    parser.add_argument('--json', action='store_true', help='In báo cáo dạng JSON')
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri).get_default_database()
+    if args.command == 'ensure':
+        ensured, errors = ensure_indexes(db)
+        print(f"✅ Đã đảm bảo {len(ensured)} index, {len(errors)} lỗi")
+    else:
+        result = index_report(db)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+        else:
+            for coll_name, r in result.items():
+                print(f"\n📦 {coll_name}")
+                print("   thiếu:      ", ', '.join(r['missing']) or '-')
+                print("   không dùng: ", ', '.join(u['name'] for u in r['unused']) or '-')
+                print("   dư thừa:    ", ', '.join(f"{x['name']} (⊂ {x['covered_by']})" for x in r['redundant']) or '-')
+                print("   ngoài registry:", ', '.join(r['unregistered']) or '-')
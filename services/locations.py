@@ -0,0 +1,217 @@
+import datetime
+import threading
+import time
+from pymongo import UpdateOne
+from pymongo.errors import CollectionInvalid, PyMongoError
+from services import geo
+from services.cache import response_cache
+from services.http_cache import bump_version
+
+TRAIL_COLLECTION = 'shipper_trails'
+# Ping có ts vượt quá giờ server hơn ngưỡng này bị từ chối (ping tương lai sẽ chặn mọi ping thật sau đó)
+MAX_CLOCK_SKEW = 60.0
+# Chưa có DB để kiểm tra shipper_code: giới hạn số shipper giữ trong bộ nhớ
+MAX_TRACKED = 100_000
+
+
+def _parse_ts(value):
+    """Epoch giây/mili giây hoặc chuỗi ISO -> epoch giây (UTC)"""
+    if value is None or value == '':
+        return time.time()
+    if isinstance(value, (int, float)):
+        return value / 1000.0 if value > 1e11 else float(value)
+    dt = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+def _utc(ts):
+    return datetime.datetime.utcfromtimestamp(ts)
+
+
+class LocationBuffer:
+    """Gộp ping GPS trong bộ nhớ theo shipper (last-write-wins) và ghi định kỳ bằng bulk_write.
+
+    Mỗi lần flush ghi tối đa một UpdateOne cho mỗi shipper có thay đổi, nên số lệnh ghi
+    không phụ thuộc tần suất ping. Vệt di chuyển được lấy mẫu thưa theo trail_interval.
+    """
+
+    def __init__(self, flush_interval=2.0, trail_interval=30.0, version_interval=30.0, known_refresh=60.0):
+        self.flush_interval = flush_interval
+        self.trail_interval = trail_interval
+        # Tăng version 'shippers' (ETag + response cache /api/shippers/all) tối đa một lần mỗi version_interval
+        self.version_interval = version_interval
+        self.known_refresh = known_refresh
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._dirty = set()
+        self._last_trail = {}
+        self._known = set()
+        self._known_at = None
+        self._last_bump = 0.0
+        self._bump_pending = False
+        self._stop = None
+        self._thread = None
+        self._db = None
+        self.stats = {'pings': 0, 'stale': 0, 'unknown': 0, 'flushes': 0, 'updates': 0, 'trail_points': 0}
+
+    def _is_known(self, code):
+        """shipper_code có trong collection shippers; tập mã được nạp lại tối đa mỗi known_refresh giây"""
+        if self._db is None:
+            return code in self._latest or len(self._latest) < MAX_TRACKED
+        if code in self._known:
+            return True
+        now = time.monotonic()
+        if self._known_at is None or now - self._known_at >= self.known_refresh:
+            self._known = set(self._db.shippers.distinct('shipper_code'))
+            self._known_at = now
+        return code in self._known
+
+    # --- NHẬN PING ---
+    def ingest(self, pings):
+        accepted, rejected = 0, []
+        for i, p in enumerate(pings):
+            try:
+                code = str(p.get('shipper_code') or '').strip()
+                if not code:
+                    raise ValueError('shipper_code is required')
+                lng, lat = geo.parse_point(p.get('lat'), p.get('lng'))
+                ts = _parse_ts(p.get('ts'))
+                if ts > time.time() + MAX_CLOCK_SKEW:
+                    raise ValueError('ts is in the future')
+            except (AttributeError, TypeError, ValueError) as e:
+                rejected.append({'index': i, 'error': str(e) or 'invalid ping'})
+                continue
+            try:
+                known = self._is_known(code)
+            except PyMongoError as e:
+                rejected.append({'index': i, 'error': 'database error'})
+                print("⚠️ Lỗi đọc danh sách shipper:", e)
+                continue
+            if not known:
+                self.stats['unknown'] += 1
+                rejected.append({'index': i, 'error': 'unknown shipper_code'})
+                continue
+            with self._lock:
+                self.stats['pings'] += 1
+                current = self._latest.get(code)
+                if current and current[0] >= ts:
+                    self.stats['stale'] += 1
+                else:
+                    self._latest[code] = (ts, lng, lat)
+                    self._dirty.add(code)
+            accepted += 1
+            if geo.shipper_grid.loaded:
+                item = geo.shipper_grid.get(code)
+                geo.shipper_grid.upsert(code, lng, lat, item[2] if item else {'shipper_code': code})
+        return accepted, rejected
+
+    def latest(self, code):
+        item = self._latest.get(code)
+        if not item:
+            return None
+        ts, lng, lat = item
+        return {'type': 'Point', 'coordinates': [lng, lat]}, _utc(ts)
+
+    def overlay(self, shippers):
+        """Thay current_location bằng vị trí mới nhất trong bộ nhớ (nếu có)"""
+        for s in shippers:
+            latest = self.latest(s.get('shipper_code'))
+            if latest:
+                s['current_location'], s['location_updated_at'] = latest
+        return shippers
+
+    # --- GHI XUỐNG MONGODB ---
+    def _bump(self, db, changed):
+        """Báo dữ liệu shippers đã đổi, gộp các lần flush liên tiếp trong version_interval"""
+        self._bump_pending = self._bump_pending or changed
+        now = time.monotonic()
+        if self._bump_pending and now - self._last_bump >= self.version_interval:
+            bump_version(db, 'shippers')
+            response_cache.invalidate('shippers')
+            self._last_bump = now
+            self._bump_pending = False
+
+    def flush(self, db):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            batch = {code: self._latest[code] for code in dirty}
+        if not batch:
+            self._bump(db, False)
+            return 0
+
+        now = datetime.datetime.utcnow()
+        ops, trail = [], []
+        for code, (ts, lng, lat) in batch.items():
+            point = {'type': 'Point', 'coordinates': [lng, lat]}
+            ops.append(UpdateOne(
+                {'shipper_code': code},
+                {'$set': {'current_location': point, 'location_updated_at': _utc(ts), 'updated_at': now}}
+            ))
+            if ts - self._last_trail.get(code, 0) >= self.trail_interval:
+                trail.append({'ts': _utc(ts), 'shipper_code': code, 'location': point})
+
+        try:
+            db.shippers.bulk_write(ops, ordered=False)
+            if trail:
+                db[TRAIL_COLLECTION].insert_many(trail, ordered=False)
+        except PyMongoError:
+            # Ghi lỗi: đánh dấu lại để lần flush sau thử tiếp
+            with self._lock:
+                self._dirty |= set(batch)
+            raise
+        # Chỉ ghi nhận mốc lấy mẫu vệt khi đã ghi xong, flush lỗi thì lần sau lấy lại điểm này
+        for doc in trail:
+            self._last_trail[doc['shipper_code']] = batch[doc['shipper_code']][0]
+        self._bump(db, True)
+        self.stats['flushes'] += 1
+        self.stats['updates'] += len(ops)
+        self.stats['trail_points'] += len(trail)
+        return len(ops)
+
+    def start(self, db):
+        self._db = db
+        self._stop = threading.Event()
+
+        def loop():
+            while not self._stop.wait(self.flush_interval):
+                try:
+                    self.flush(db)
+                except PyMongoError as e:
+                    print("⚠️ Lỗi ghi vị trí shipper:", e)
+
+        self._thread = threading.Thread(target=loop, name='location-flusher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._stop:
+            self._stop.set()
+            self._thread.join(timeout=5)
+        if self._db is not None:
+            # Lần flush cuối: báo version ngay, không chờ version_interval
+            self._last_bump = float('-inf')
+            try:
+                self.flush(self._db)
+            except PyMongoError as e:
+                print("⚠️ Lỗi ghi vị trí shipper khi tắt:", e)
+
+
+def ensure_trail_collection(db, expire_days=30):
+    """Tạo time-series collection cho vệt di chuyển (MongoDB 5.0+), nếu không hỗ trợ thì dùng collection thường"""
+    if TRAIL_COLLECTION in db.list_collection_names():
+        return
+    try:
+        db.create_collection(
+            TRAIL_COLLECTION,
+            timeseries={'timeField': 'ts', 'metaField': 'shipper_code', 'granularity': 'seconds'},
+            expireAfterSeconds=expire_days * 86400
+        )
+    except CollectionInvalid:
+        pass
+    except PyMongoError as e:
+        print("⚠️ Không tạo được time-series collection, dùng collection thường:", e)
+        db[TRAIL_COLLECTION].create_index([('shipper_code', 1), ('ts', -1)])
+
+
+location_buffer = LocationBuffer()
@@ -0,0 +1,217 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from flask import g, request, Response
+from pymongo import monitoring
+
+# Ngưỡng log truy vấn chậm (ms, 0 = tắt)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROUNDTRIP_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Endpoint Flask đang xử lý + bộ đếm lệnh Mongo của request; được copy sang thread fan-out
+current_endpoint = contextvars.ContextVar('current_endpoint', default='(background)')
+request_commands = contextvars.ContextVar('request_commands', default=None)
+
+# Lệnh CRUD đặt tên collection ở key trùng tên lệnh; getMore đặt ở 'collection'
+_COLLECTION_FIELD = {'getMore': 'collection'}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.roundtrips = defaultdict(lambda: Histogram(ROUNDTRIP_BUCKETS))
+        self.commands = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.command_failures = defaultdict(int)
+        self.docs_returned = defaultdict(int)
+        self.slow_queries = 0
+
+    def observe_request(self, endpoint, method, status, seconds, commands):
+        with self._lock:
+            self.requests[(endpoint, method, str(status))].observe(seconds)
+            if commands is not None:
+                self.roundtrips[(endpoint,)].observe(commands)
+
+    def observe_command(self, endpoint, command, collection, seconds, returned, failed=False):
+        key = (endpoint, command, collection)
+        with self._lock:
+            self.commands[key].observe(seconds)
+            if failed:
+                self.command_failures[key] += 1
+            if returned:
+                self.docs_returned[key] += returned
+
+    # --- XUẤT ĐỊNH DẠNG PROMETHEUS ---
+    def render(self):
+        lines = []
+
+        def labels(names, values, extra=None):
+            pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+            if extra:
+                pairs.append(extra)
+            return '{' + ','.join(pairs) + '}'
+
+        def histogram(name, help_text, data, names):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, h in sorted(data.items()):
+                cumulative = 0
+                for bound, c in zip(h.buckets, h.counts):
+                    cumulative += c
+                    le = labels(names, key, 'le="%s"' % bound)
+                    lines.append(f'{name}_bucket{le} {cumulative}')
+                le = labels(names, key, 'le="+Inf"')
+                lines.append(f'{name}_bucket{le} {h.count}')
+                lines.append(f'{name}_sum{labels(names, key)} {h.sum:.6f}')
+                lines.append(f'{name}_count{labels(names, key)} {h.count}')
+
+        def counter(name, help_text, data, names):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for key, v in sorted(data.items()):
+                lines.append(f'{name}{labels(names, key)} {v}')
+
+        with self._lock:
+            histogram('http_request_duration_seconds', 'HTTP request latency by endpoint.',
+                      self.requests, ('endpoint', 'method', 'status'))
+            histogram('http_request_mongo_roundtrips', 'MongoDB commands issued per HTTP request.',
+                      self.roundtrips, ('endpoint',))
+            histogram('mongo_command_duration_seconds', 'MongoDB command latency by issuing endpoint.',
+                      self.commands, ('endpoint', 'command', 'collection'))
+            counter('mongo_command_failures_total', 'Failed MongoDB commands.',
+                    self.command_failures, ('endpoint', 'command', 'collection'))
+            counter('mongo_docs_returned_total', 'Documents returned to the app by MongoDB commands.',
+                    self.docs_returned, ('endpoint', 'command', 'collection'))
+            lines.append('# HELP mongo_slow_queries_total Commands slower than SLOW_QUERY_MS.')
+            lines.append('# TYPE mongo_slow_queries_total counter')
+            lines.append(f'mongo_slow_queries_total {self.slow_queries}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _shape(cmd):
+    """Tóm tắt hình dạng lệnh cho slow log: field lọc / các stage, không kèm giá trị"""
+    if isinstance(cmd.get('pipeline'), list):
+        return '[' + ','.join(next(iter(st), '?') for st in cmd['pipeline'] if isinstance(st, dict)) + ']'
+    for key in ('filter', 'query', 'q'):
+        if isinstance(cmd.get(key), dict):
+            return '{' + ','.join(cmd[key]) + '}'
+    return ''
+
+
+def _docs_returned(reply):
+    """Số document trả về app: batch của find/aggregate/getMore, 1 với findAndModify có kết quả"""
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+    return 1 if reply.get('value') else 0
+
+
+registry = Registry()
+
+
+# --- LẮNG NGHE LỆNH PYMONGO ---
+class CommandRecorder(monitoring.CommandListener):
+    """Ghi thời gian, collection, số document trả về của mọi lệnh Mongo theo endpoint Flask.
+
+    Số document đã quét (docsExamined) không có trong reply của lệnh: xem bằng explain
+    (importdata/query_plans.py) hoặc profiler của mongod với các lệnh bị log là chậm.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event):
+        return event.connection_id, event.request_id, event.operation_id
+
+    def started(self, event):
+        cmd = event.command
+        field = _COLLECTION_FIELD.get(event.command_name, event.command_name)
+        collection = cmd.get(field)
+        if not isinstance(collection, str):
+            collection = ''
+        with self._lock:
+            self._pending[self._key(event)] = (collection, event.database_name,
+                                               _shape(cmd) if SLOW_QUERY_MS else '')
+        counter = request_commands.get()
+        if counter is not None:
+            counter[0] += 1
+
+    def _finish(self, event, reply, failed):
+        with self._lock:
+            collection, database, shape = self._pending.pop(self._key(event), ('', '', ''))
+        seconds = event.duration_micros / 1e6
+        endpoint = current_endpoint.get()
+        returned = 0 if failed else _docs_returned(reply)
+        registry.observe_command(endpoint, event.command_name, collection, seconds, returned, failed)
+        if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+            registry.slow_queries += 1
+            print(f"🐢 Slow query {seconds * 1000:.1f}ms endpoint={endpoint} "
+                  f"{event.command_name} {database}.{collection} {shape} returned={returned}")
+
+    def succeeded(self, event):
+        self._finish(event, event.reply, False)
+
+    def failed(self, event):
+        self._finish(event, None, True)
+
+
+command_recorder = CommandRecorder()
+
+
+# --- ĐO THỜI GIAN REQUEST ---
+def init_metrics(app):
+    @app.before_request
+    def _start_timer():
+        g._metrics_started = time.perf_counter()
+        g._metrics_tokens = (
+            current_endpoint.set(request.endpoint or '(unmatched)'),
+            request_commands.set([0]),
+        )
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None and request.endpoint != 'metrics':
+            counter = request_commands.get()
+            registry.observe_request(request.endpoint or '(unmatched)', request.method, response.status_code,
+                                     time.perf_counter() - started, counter[0] if counter else None)
+        return response
+
+    @app.teardown_request
+    def _reset_context(exc=None):
+        tokens = g.pop('_metrics_tokens', None)
+        if tokens:
+            try:
+                current_endpoint.reset(tokens[0])
+                request_commands.reset(tokens[1])
+            except ValueError:
+                # Response streaming (SSE) kết thúc trong context khác: không cần khôi phục
+                pass
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,195 @@
+import datetime
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+_STOP = object()
+# Bộ đếm chưa đọc theo user: {_id: user_id, unread: n}
+COUNTERS = 'notification_counters'
+
+
+class NotificationDispatcher:
+    """Ghi notification ở thread nền: gom theo lô từ hàng đợi giới hạn rồi insert_many.
+
+    Flush khi đủ batch_size hoặc sau flush_interval giây. Hàng đợi đầy (DB chậm) thì
+    publish chờ tối đa put_timeout rồi tự ghi đồng bộ: request chậm lại thay vì mất dữ liệu
+    hoặc tràn bộ nhớ. Chưa start (script CLI) thì ghi đồng bộ.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval=0.5, put_timeout=0.05):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(max_queue)
+        self._db = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.stats = {'queued': 0, 'sync': 0, 'written': 0, 'batches': 0, 'failed': 0}
+
+    def start(self, db):
+        with self._start_lock:
+            self._db = db
+            self._pid = os.getpid()
+            self._queue = queue.Queue(self.max_queue)
+            self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+            self._thread.start()
+
+    def _running(self):
+        if self._thread is None:
+            return False
+        if self._pid != os.getpid():
+            # Process con sau fork (gunicorn --preload) không có thread nền: khởi động lại
+            self.start(self._db)
+        return True
+
+    # --- GHI NOTIFICATION ---
+    def publish(self, db, docs):
+        docs = [d for d in docs if d]
+        if not docs:
+            return
+        if not self._running():
+            self._write(db, docs)
+            self.stats['sync'] += len(docs)
+            return
+        for i, doc in enumerate(docs):
+            try:
+                self._queue.put(doc, timeout=self.put_timeout)
+                self.stats['queued'] += 1
+            except queue.Full:
+                self._write(db, docs[i:])
+                self.stats['sync'] += len(docs) - i
+                return
+
+    def _write(self, db, docs):
+        db.notifications.insert_many(docs, ordered=False)
+        inc_unread(db, Counter(d['user_id'] for d in docs if d.get('user_id') and not d.get('is_read')))
+        self.stats['written'] += len(docs)
+        self.stats['batches'] += 1
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch:
+                try:
+                    self._write(self._db, batch)
+                except PyMongoError as e:
+                    self.stats['failed'] += len(batch)
+                    print(f"⚠️ Lỗi ghi {len(batch)} notification:", e)
+
+    def stop(self, timeout=10):
+        """Ghi nốt hàng đợi khi tắt app"""
+        if not self._thread or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+        # Phần còn sót (nếu thread dừng do timeout) ghi đồng bộ
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self._write(self._db, leftover)
+
+    def pending(self):
+        return self._queue.qsize()
+
+
+# --- HỘP THƯ ---
+INBOX_FIELDS = {'user_id': 1, 'type': 1, 'order_code': 1, 'message': 1, 'timestamp': 1, 'is_read': 1}
+
+
+def inbox_filter(user_id, unread_only=False):
+    # is_read luôn có trong điều kiện để dùng index (user_id, is_read, timestamp):
+    # với cả hai trạng thái, $in cho phép MongoDB merge-sort hai khoảng index thay vì sort trong bộ nhớ
+    return {'user_id': user_id, 'is_read': False if unread_only else {'$in': [False, True]}}
+
+
+# --- BỘ ĐẾM CHƯA ĐỌC ---
+def inc_unread(db, counts):
+    """Cộng/trừ bộ đếm chưa đọc theo lô: {user_id: delta}"""
+    ops = [UpdateOne({'_id': user}, {'$inc': {'unread': n}}, upsert=True) for user, n in counts.items() if n]
+    if ops:
+        db[COUNTERS].bulk_write(ops, ordered=False)
+
+
+def unread_count(db, user_id):
+    doc = db[COUNTERS].find_one({'_id': user_id}, {'unread': 1})
+    return max((doc or {}).get('unread', 0), 0)
+
+
+def mark_read(db, user_id, notification_id=None):
+    """Đánh dấu một hoặc tất cả notification chưa đọc của user là đã đọc, trả về số bản ghi đổi"""
+    query = {'user_id': user_id, 'is_read': False}
+    if notification_id is not None:
+        query['_id'] = notification_id
+    update = {'$set': {'is_read': True, 'read_at': datetime.datetime.utcnow()}}
+    modified = db.notifications.update_many(query, update).modified_count
+    # Trừ đúng số đã đổi để không đè lên notification mới ghi cùng lúc
+    inc_unread(db, {user_id: -modified})
+    return modified
+
+
+def rebuild_unread_counts(db):
+    """Dựng lại bộ đếm từ notifications (dùng sau sự cố hoặc dữ liệu import ngoài app)"""
+    counts = {row['_id']: row['n'] for row in db.notifications.aggregate([
+        {'$match': {'is_read': False, 'user_id': {'$ne': None}}},
+        {'$group': {'_id': '$user_id', 'n': {'$sum': 1}}}
+    ])}
+    db[COUNTERS].delete_many({'_id': {'$nin': list(counts)}})
+    if counts:
+        db[COUNTERS].bulk_write([UpdateOne({'_id': u}, {'$set': {'unread': n}}, upsert=True)
+                                 for u, n in counts.items()], ordered=False)
+    return counts
+
+
+dispatcher = NotificationDispatcher()
+
+
+def publish(db, *docs):
+    dispatcher.publish(db, list(docs))
+
+
+def publish_many(db, docs):
+    dispatcher.publish(db, list(docs))
+
+
+if __name__ == '__main__':
+    import argparse
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description='Dựng lại bộ đếm notification chưa đọc')
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ViettelPost_DB'))
+    args = parser.parse_args()
+
+    counts = rebuild_unread_counts(MongoClient(args.uri).get_default_database())
+    print(f"✅ Đã dựng lại bộ đếm cho {len(counts)} user, tổng {sum(counts.values())} chưa đọc")
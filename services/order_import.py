@@ -0,0 +1,141 @@
+import csv
+import datetime
+import io
+import json
+from pymongo.errors import BulkWriteError
+from services.code_allocator import reserve_order_codes
+from services import dashboard_stats, notifications
+from services.orders import build_order, validate_order_data
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 10000
+
+
+# --- ĐỌC DÒNG TỪ STREAM ---
+def iter_ndjson(stream):
+    """Sinh (số dòng, dict | None, lỗi | None) từ stream NDJSON dạng text"""
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, "row must be a JSON object"
+            continue
+        yield line_no, row, None
+
+
+def iter_csv(stream):
+    reader = csv.DictReader(stream)
+    # Dòng 1 là header nên dòng dữ liệu bắt đầu từ 2
+    for line_no, row in enumerate(reader, start=2):
+        yield line_no, row, None
+
+
+def iter_rows(stream, fmt):
+    return iter_csv(stream) if fmt == 'csv' else iter_ndjson(stream)
+
+
+def _normalize_row(row):
+    data = {k: ('' if v is None else v) for k, v in row.items() if k}
+    # Form gửi checkbox là "on"; NDJSON có thể gửi true/1
+    if str(data.get('is_fragile', '')).lower() in ('on', 'true', '1', 'yes'):
+        data['is_fragile'] = 'on'
+    return data
+
+
+# --- GHI MỘT LÔ ---
+def _write_chunk(db, chunk, report):
+    """chunk: list (line_no, data) đã hợp lệ"""
+    need_code = [data for _, data in chunk if not str(data.get('order_code') or '').strip()]
+    for data, code in zip(need_code, reserve_order_codes(db, len(need_code))):
+        data['order_code'] = code
+
+    docs = [build_order(data) for _, data in chunk]
+    failed = set()
+    try:
+        db.orders.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get('writeErrors', []):
+            failed.add(err['index'])
+            report['errors'].append({'row': chunk[err['index']][0], 'errors': [err.get('errmsg', 'write error')]})
+
+    inserted = [doc for i, doc in enumerate(docs) if i not in failed]
+    if not inserted:
+        return
+    now = datetime.datetime.utcnow()
+    notifications.publish_many(db, [{
+        "order_id": str(doc["_id"]),
+        "order_code": doc["order_code"],
+        "type": "ORDER_CREATED",
+        "message": "New order created",
+        "timestamp": now,
+        "is_read": False
+    } for doc in inserted])
+    dashboard_stats.record_created(db, "PENDING_PICKUP", len(inserted))
+    report['inserted'] += len(inserted)
+
+
+def import_orders(db, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Nạp đơn hàng theo lô: validate, giữ chỗ mã theo lô, insert_many không thứ tự.
+
+    rows: iterable (line_no, dict | None, lỗi parse | None). Trả về báo cáo
+    {'inserted', 'failed', 'errors': [{'row', 'errors'}]}.
+    """
+    chunk_size = max(1, min(int(chunk_size), MAX_CHUNK_SIZE))
+    report = {'inserted': 0, 'failed': 0, 'errors': []}
+    chunk = []
+    for line_no, row, parse_error in rows:
+        if parse_error:
+            report['errors'].append({'row': line_no, 'errors': [parse_error]})
+            continue
+        data = _normalize_row(row)
+        errors = validate_order_data(data)
+        if errors:
+            report['errors'].append({'row': line_no, 'errors': errors})
+            continue
+        chunk.append((line_no, data))
+        if len(chunk) >= chunk_size:
+            _write_chunk(db, chunk, report)
+            chunk = []
+    if chunk:
+        _write_chunk(db, chunk, report)
+    report['failed'] = len(report['errors'])
+    report['errors'].sort(key=lambda e: e['row'])
+    return report
+
+
+def import_stream(db, binary_stream, fmt='ndjson', chunk_size=DEFAULT_CHUNK_SIZE):
+    text = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    return import_orders(db, iter_rows(text, fmt), chunk_size)
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import sys
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description='Nạp hàng loạt đơn hàng từ file NDJSON/CSV')
+    parser.add_argument('file', help="Đường dẫn file, '-' để đọc stdin")
+    parser.add_argument('--format', choices=['ndjson', 'csv'], help='Mặc định đoán theo đuôi file')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--errors-out', help='Ghi báo cáo lỗi từng dòng ra file NDJSON')
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ViettelPost_DB'))
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.file.lower().endswith('.csv') else 'ndjson')
+    db = MongoClient(args.uri).get_default_database()
+    source = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+    with source:
+        result = import_stream(db, source, fmt, args.chunk_size)
+
+    if args.errors_out:
+        with open(args.errors_out, 'w', encoding='utf-8') as f:
+            for err in result['errors']:
+                f.write(json.dumps(err, ensure_ascii=False) + '\n')
+    print(f"✅ Đã nạp {result['inserted']} đơn, {result['failed']} dòng lỗi")
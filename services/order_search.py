@@ -0,0 +1,127 @@
+import re
+import threading
+import unicodedata
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+# Chuỗi chỉ gồm số và ký tự định dạng số điện thoại
+PHONE_LIKE = re.compile(r'^[\d\s+().-]+$')
+# Mã đơn: chữ cái đầu + có chữ số, không khoảng trắng (VT202501010001, OD123456...)
+CODE_LIKE = re.compile(r'^[A-Za-z]+[-_]?\d[\w-]*$')
+MIN_PREFIX = 3
+
+
+# --- CHUẨN HÓA ---
+def normalize_text(value):
+    """Chữ thường, bỏ dấu tiếng Việt, gộp khoảng trắng"""
+    if not value:
+        return ''
+    value = str(value).replace('đ', 'd').replace('Đ', 'D')
+    value = unicodedata.normalize('NFD', value)
+    value = ''.join(c for c in value if unicodedata.category(c) != 'Mn')
+    return ' '.join(value.lower().split())
+
+
+def normalize_phone(value):
+    return re.sub(r'\D', '', str(value or ''))
+
+
+def phone_keys(value):
+    """Các dạng số để tra cứu: nguyên bản và dạng 0xxx/84xxx tương ứng"""
+    digits = normalize_phone(value)
+    if not digits:
+        return []
+    keys = [digits]
+    if digits.startswith('84') and len(digits) > 9:
+        keys.append('0' + digits[2:])
+    elif digits.startswith('0'):
+        keys.append('84' + digits[1:])
+    return keys
+
+
+def build_search_keys(order_code, name, phone):
+    return {
+        'code': (order_code or '').strip().lower(),
+        'name': normalize_text(name),
+        'phone': phone_keys(phone)
+    }
+
+
+# --- ĐỊNH TUYẾN TRUY VẤN ---
+def build_search_filter(q, scan=False):
+    """Trả về (filter, mode) cho từ khóa q.
+
+    Mặc định chỉ dùng truy vấn có index: tiền tố số điện thoại, tiền tố mã đơn,
+    hoặc text index trên tên người nhận. scan=True mới quét regex không neo.
+    """
+    q = (q or '').strip()
+    if not q:
+        return None, None
+
+    if scan:
+        pattern = {'$regex': re.escape(q), '$options': 'i'}
+        return {'$or': [
+            {'order_code': pattern},
+            {'recipient_info.name': pattern},
+            {'recipient_info.phone': pattern}
+        ]}, 'scan'
+
+    digits = normalize_phone(q)
+    if PHONE_LIKE.match(q) and len(digits) >= MIN_PREFIX:
+        return {'search_keys.phone': {'$regex': '^' + re.escape(digits)}}, 'phone_prefix'
+
+    if CODE_LIKE.match(q):
+        code = q.lower()
+        if len(code) < MIN_PREFIX:
+            return {'search_keys.code': code}, 'code_exact'
+        return {'search_keys.code': {'$regex': '^' + re.escape(code)}}, 'code_prefix'
+
+    return {'$text': {'$search': normalize_text(q)}}, 'name_text'
+
+
+# --- BỔ SUNG KHÓA CHO DỮ LIỆU CŨ ---
+def backfill_search_keys(db, batch_size=1000):
+    ops, total = [], 0
+    cursor = db.orders.find(
+        {'search_keys': {'$exists': False}},
+        {'order_code': 1, 'recipient_info.name': 1, 'recipient_info.phone': 1}
+    ).batch_size(batch_size)
+    for o in cursor:
+        ri = o.get('recipient_info') or {}
+        keys = build_search_keys(o.get('order_code'), ri.get('name'), ri.get('phone'))
+        ops.append(UpdateOne({'_id': o['_id']}, {'$set': {'search_keys': keys}}))
+        if len(ops) >= batch_size:
+            total += db.orders.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        total += db.orders.bulk_write(ops, ordered=False).modified_count
+    return total
+
+
+def backfill_search_keys_async(db):
+    """Bổ sung search_keys ở thread nền khi app khởi động (đơn do script cũ / import tay ghi vào)"""
+    def run():
+        try:
+            n = backfill_search_keys(db)
+            if n:
+                print(f"✅ Đã bổ sung search_keys cho {n} đơn hàng")
+        except PyMongoError as e:
+            print("⚠️ Lỗi bổ sung search_keys:", e)
+
+    thread = threading.Thread(target=run, name='backfill-search-keys', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description='Bổ sung search_keys cho các đơn hàng cũ')
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ViettelPost_DB'))
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    n = backfill_search_keys(MongoClient(args.uri).get_default_database(), args.batch_size)
+    print(f"✅ Đã cập nhật search_keys cho {n} đơn hàng")
@@ -0,0 +1,123 @@
+import datetime
+import re
+from services.order_search import build_search_filter, build_search_keys
+from services.pagination import and_filters
+
+# Dựng và kiểm tra document đơn hàng: dùng chung cho form (routes/order_routes.py) và import (services/order_import.py)
+
+# Đơn chưa xóa mềm (đơn cũ có thể thiếu is_deleted)
+NOT_DELETED = {"$or": [{"is_deleted": False}, {"is_deleted": {"$exists": False}}]}
+
+
+def list_filter(q='', status='', scan=False):
+    """Điều kiện của GET /api/orders: đơn chưa xóa + tìm kiếm + trạng thái. Trả về (query, search_mode)"""
+    search, search_mode = build_search_filter(q, scan=scan)
+    # and_filters trả lại chính NOT_DELETED khi không tìm kiếm: chép ra trước khi thêm điều kiện
+    query = dict(and_filters(NOT_DELETED, search))
+    if status:
+        query["current_status"] = status
+    return query, search_mode
+
+# --- HÀM HỖ TRỢ ---
+def safe_float(value):
+    try:
+        if value is None or str(value).strip() == "":
+            return 0.0
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+# Cùng ràng buộc với form order_form.html
+PHONE_PATTERN = re.compile(r'^\+?\d{9,15}$')
+REQUIRED_FIELDS = ['recipient_name', 'recipient_phone', 'recipient_address']
+NUMERIC_FIELDS = ['weight', 'dim_l', 'dim_w', 'dim_h', 'declared_value', 'quantity',
+                  'cod_amount', 'shipping_fee', 'insurance_fee']
+
+def validate_order_data(data):
+    """Trả về danh sách lỗi của dữ liệu đơn (rỗng nếu hợp lệ)"""
+    errors = []
+    for field in REQUIRED_FIELDS:
+        if not str(data.get(field) or '').strip():
+            errors.append(f"{field} is required")
+    phone = str(data.get('recipient_phone') or '').strip()
+    if phone and not PHONE_PATTERN.match(phone):
+        errors.append("recipient_phone is invalid")
+    for field in NUMERIC_FIELDS:
+        value = data.get(field)
+        if value is None or str(value).strip() == "":
+            continue
+        try:
+            if float(value) < 0:
+                errors.append(f"{field} must not be negative")
+        except (ValueError, TypeError):
+            errors.append(f"{field} must be a number")
+    return errors
+
+# --- TẠO ORDER MỚI ---
+def build_order(data, code=None):
+    """Document đơn mới từ dữ liệu form / dòng import; code=None thì lấy data['order_code']"""
+    code = code or str(data.get('order_code') or '').strip()
+
+    return {
+        "order_code": code,
+        # Khóa tìm kiếm đã chuẩn hóa (lowercase, bỏ dấu, số điện thoại chỉ còn chữ số)
+        "search_keys": build_search_keys(code, data.get('recipient_name', ''), data.get('recipient_phone', '')),
+        "recipient_info": {
+            "name": data.get('recipient_name', ''),
+            "phone": data.get('recipient_phone', ''),
+            "address": data.get('recipient_address', '')
+        },
+        "sender_info": {
+            "name": data.get('sender_name', ''),
+            "phone": data.get('sender_phone', '')
+        },
+        "parcel": {
+            "weight": safe_float(data.get("weight")),
+            "dimensions": {
+                "l": safe_float(data.get("dim_l")),
+                "w": safe_float(data.get("dim_w")),
+                "h": safe_float(data.get("dim_h"))
+            },
+            "contents": data.get("contents", ""),
+            "is_fragile": data.get("is_fragile") == "on",
+            "declared_value": safe_float(data.get("declared_value")),
+            "quantity": safe_float(data.get("quantity", 1))
+        },
+        "financials": {
+            "cod_amount": safe_float(data.get("cod_amount")),
+            "shipping_fee": safe_float(data.get("shipping_fee")),
+            "insurance_fee": safe_float(data.get("insurance_fee")),
+            "total_amount": (
+                safe_float(data.get("cod_amount")) +
+                safe_float(data.get("shipping_fee")) +
+                safe_float(data.get("insurance_fee"))
+            )
+        },
+        "current_status": "PENDING_PICKUP",
+        "created_at": datetime.datetime.utcnow(),
+        "updated_at": datetime.datetime.utcnow(),
+        "is_deleted": False
+    }
+
+# --- TẠO ORDER CHO FORM (GET) ---
+def get_empty_order(code=""):
+    return {
+        "order_code": code,
+        "recipient_info": {"name": "", "phone": "", "address": ""},
+        "sender_info": {"name": "", "phone": ""},
+        "parcel": {
+            "weight": 0,
+            "dimensions": {"l": 0, "w": 0, "h": 0},
+            "contents": "",
+            "is_fragile": False,
+            "declared_value": 0,
+            "quantity": 1
+        },
+        "financials": {
+            "cod_amount": 0,
+            "shipping_fee": 0,
+            "insurance_fee": 0,
+            "total_amount": 0
+        },
+        "current_status": "PENDING_PICKUP"
+    }
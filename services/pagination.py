@@ -0,0 +1,73 @@
+import base64
+import json
+from datetime import datetime
+from bson.objectid import ObjectId
+
+def page_sort(field='created_at'):
+    """Thứ tự sắp xếp ổn định cho keyset pagination: field giảm dần, _id phá thế hòa"""
+    return [(field, -1), ('_id', -1)]
+
+
+ORDER_SORT = page_sort()
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(doc, field='created_at'):
+    """Mã hóa (created_at, _id) của bản ghi cuối trang thành token opaque"""
+    created = doc.get(field)
+    payload = {
+        'c': created.isoformat() if isinstance(created, datetime) else None,
+        'i': str(doc['_id'])
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created = datetime.fromisoformat(payload['c']) if payload.get('c') else None
+        return created, ObjectId(payload['i'])
+    except Exception as e:
+        raise InvalidCursor(f'Invalid cursor: {token}') from e
+
+
+def seek_filter(token, field='created_at'):
+    """Điều kiện range tương ứng với vị trí sau cursor theo ORDER_SORT"""
+    created, oid = decode_cursor(token)
+    if created is None:
+        # Bản ghi không có created_at nằm cuối khi sort giảm dần
+        return {field: None, '_id': {'$lt': oid}}
+    return {'$or': [
+        {field: {'$lt': created}},
+        {field: created, '_id': {'$lt': oid}}
+    ]}
+
+
+def and_filters(*filters):
+    """Ghép nhiều điều kiện bằng $and, bỏ qua điều kiện rỗng"""
+    parts = [f for f in filters if f]
+    if not parts:
+        return {}
+    if len(parts) == 1:
+        return parts[0]
+    return {'$and': parts}
+
+
+def fetch_page(collection, query, projection, limit, cursor=None, field='created_at'):
+    """Lấy một trang theo keyset (field giảm dần, _id phá thế hòa), trả về (docs, next_cursor)"""
+    # limit <= 0 thành .limit(0)/.limit(1) = không giới hạn hoặc trang rỗng: luôn giữ trong [1, MAX_PAGE_SIZE]
+    limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+    if cursor:
+        query = and_filters(query, seek_filter(cursor, field))
+    docs = list(collection.find(query, projection).sort(page_sort(field)).limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], field)
+    return docs, next_cursor
@@ -0,0 +1,49 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Pool dùng chung cho các truy vấn độc lập trong cùng một request (fan-out)
+FANOUT_WORKERS = int(os.environ.get('QUERY_FANOUT_WORKERS', 16))
+
+_executor = None
+_pid = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _pid
+    with _lock:
+        # Sau fork (gunicorn --preload) thread của pool cũ không còn: tạo pool mới
+        if _executor is None or _pid != os.getpid():
+            _executor = ThreadPoolExecutor(FANOUT_WORKERS, thread_name_prefix='query-fanout')
+            _pid = os.getpid()
+        return _executor
+
+
+def run_parallel(*calls, return_exceptions=False):
+    """Chạy các hàm không tham số song song, trả về kết quả theo đúng thứ tự.
+
+    Hàm đầu tiên chạy ngay trên thread của request, các hàm còn lại chạy trên pool, nên tổng
+    thời gian xấp xỉ truy vấn chậm nhất. return_exceptions=True: lỗi được trả về tại vị trí
+    tương ứng thay vì raise (giống asyncio.gather).
+    """
+    if not calls:
+        return []
+    # Mỗi tác vụ chạy trong bản sao context của request (endpoint cho metrics...)
+    futures = [_get_executor().submit(contextvars.copy_context().run, fn) for fn in calls[1:]]
+    results = []
+    try:
+        results.append(calls[0]())
+    except Exception as e:
+        if not return_exceptions:
+            raise
+        results.append(e)
+    for f in futures:
+        try:
+            results.append(f.result())
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
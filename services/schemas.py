@@ -0,0 +1,33 @@
+from services.serialization import Schema
+
+
+def _datetime_str(dt):
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# /api/orders/all, /api/orders (api_bp): dòng bảng đơn rút gọn
+ORDER_ROW = Schema(
+    '_id', 'order_code',
+    ('recipient_name', 'recipient_info.name'),
+    ('recipient_phone', 'recipient_info.phone'),
+    'current_status', 'created_at',
+)
+
+# /api/orders (order_bp): các cột của templates/orders.html
+ORDER_TABLE = Schema(
+    '_id', 'order_code',
+    'sender_info.name', 'sender_info.phone',
+    'recipient_info.name', 'recipient_info.phone',
+    'current_status', 'financials.cod_amount', 'parcel.declared_value',
+    'created_at', ('created_at_str', 'created_at', _datetime_str),
+)
+
+# /api/postoffices/all
+POST_OFFICE = Schema('office_code', 'name', 'address', 'location', 'operating_hours', 'phone_number')
+
+# /api/shippers/all: shipper + bưu cục hiện tại ($lookup post_office_info)
+SHIPPER = Schema(
+    '_id', 'shipper_code', 'full_name', 'phone_number', 'status',
+    'current_location', 'location_updated_at', 'current_post_office_id',
+    'post_office_info.office_code', 'post_office_info.name',
+)
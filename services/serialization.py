@@ -0,0 +1,111 @@
+import json
+from datetime import date, datetime
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, không có thì dùng json của thư viện chuẩn
+    orjson = None
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def _default(o):
+    """Kiểu BSON -> JSON: ObjectId thành chuỗi hex, datetime ISO 8601, Decimal128 thành số"""
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, Decimal128):
+        return float(o.to_decimal())
+    return DefaultJSONProvider.default(o)
+
+
+def dumps_bytes(obj):
+    """JSON gọn dạng bytes UTF-8 (dòng NDJSON...), cùng quy tắc encode với MongoJSONProvider"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """JSON provider của app: jsonify nhận thẳng document Mongo, không cần str(_id) trong handler"""
+    default = staticmethod(_default)
+    # Thứ tự key theo document/schema, giống nhau dù có orjson hay không
+    sort_keys = False
+
+    def _fast(self):
+        return orjson is not None and not (self.compact is False or (self.compact is None and self._app.debug))
+
+    def _options(self):
+        return _OPTIONS | orjson.OPT_SORT_KEYS if self.sort_keys else _OPTIONS
+
+    def dumps(self, obj, **kwargs):
+        # orjson luôn ghi dạng gọn: chỉ dùng khi không yêu cầu định dạng khác
+        if orjson is None or set(kwargs) - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if not self._fast():
+            return super().response(*args, **kwargs)
+        # Ghi thẳng bytes vào response, bỏ qua bước decode/encode chuỗi
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+# --- SCHEMA RESPONSE: CÙNG MỘT DANH SÁCH FIELD CHO PROJECTION VÀ OUTPUT ---
+class Schema:
+    """Các field một endpoint trả về.
+
+    Mỗi field là đường dẫn ('recipient_info.name': giữ nguyên dạng lồng nhau) hoặc
+    (key output, đường dẫn[, hàm chuyển đổi]) để đổi tên / tính giá trị. projection chỉ lấy
+    đúng các đường dẫn này; schema chỉ gồm đường dẫn thì dump trả lại document như projection.
+    """
+
+    def __init__(self, *fields):
+        self.fields = []
+        for f in fields:
+            if isinstance(f, str):
+                self.fields.append((None, f, None))
+            else:
+                out, path, *convert = f
+                self.fields.append((out, path, convert[0] if convert else None))
+        paths = [path for _, path, _ in self.fields]
+        # Key cấp cao nhất của output (header CSV)
+        self.columns = list(dict.fromkeys(out or path.split('.', 1)[0] for out, path, _ in self.fields))
+        self.projection = {p: 1 for p in dict.fromkeys(paths)}
+        if '_id' not in self.projection:
+            self.projection['_id'] = 0
+        self._reshape = any(out is not None for out, _, _ in self.fields)
+
+    def prefixed(self, prefix):
+        """Projection cho document lồng trong một field (vd. kết quả $lookup)"""
+        return {f'{prefix}.{p}': v for p, v in self.projection.items() if v}
+
+    def dump(self, doc):
+        if not self._reshape:
+            return doc
+        out = {}
+        for key, path, convert in self.fields:
+            if key is None:
+                head = path.split('.', 1)[0]
+                if head in doc:
+                    out[head] = doc[head]
+                continue
+            value = doc
+            for part in path.split('.'):
+                value = value.get(part) if isinstance(value, dict) else None
+            out[key] = convert(value) if convert and value is not None else value
+        return out
+
+    def dump_many(self, docs):
+        return [self.dump(d) for d in docs]
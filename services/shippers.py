@@ -0,0 +1,49 @@
+ACTIVE_STATUSES = ['ON_DUTY', 'ACTIVE']
+# Các field /api/shippers/active trả về
+ACTIVE_SHIPPER_FIELDS = ['shipper_code', 'full_name', 'phone_number', 'current_post_office_name', 'status']
+
+
+def shippers_with_office_pipeline(projection=None):
+    """Shipper kèm bưu cục hiện tại (post_office_info), dùng cho /shippers và /api/shippers/all"""
+    pipeline = [
+        {'$lookup': {
+            'from': 'post_offices',
+            'localField': 'current_post_office_id',
+            'foreignField': '_id',
+            'as': 'post_office_info'
+        }},
+        {'$unwind': {'path': '$post_office_info', 'preserveNullAndEmptyArrays': True}}
+    ]
+    if projection:
+        pipeline.append({'$project': projection})
+    return pipeline
+
+
+def active_shippers_pipeline(fields=None):
+    """Một aggregation duy nhất: lọc shipper đang hoạt động + $lookup tên bưu cục"""
+    pipeline = [
+        {'$match': {'status': {'$in': ACTIVE_STATUSES}}},
+        {'$lookup': {
+            'from': 'post_offices',
+            'localField': 'current_post_office_id',
+            'foreignField': '_id',
+            'as': '_post_office'
+        }},
+        {'$addFields': {'current_post_office_name': {'$arrayElemAt': ['$_post_office.name', 0]}}},
+        {'$project': {'_post_office': 0}}
+    ]
+    if fields:
+        project = {f: 1 for f in fields}
+        project.setdefault('_id', 0)
+        pipeline.append({'$project': project})
+    return pipeline
+
+
+def find_active_shippers(db, fields=None):
+    shps = list(db.shippers.aggregate(active_shippers_pipeline(fields)))
+    for s in shps:
+        for k in ('_id', 'current_post_office_id'):
+            if s.get(k) is not None:
+                s[k] = str(s[k])
+        s.setdefault('current_post_office_name', None)
+    return shps
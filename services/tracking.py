@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Mã hợp lệ (VT..., TRKVT...): mã sai định dạng trả "không tìm thấy" mà không chạm DB
+CODE_PATTERN = re.compile(os.environ.get('TRACK_CODE_PATTERN', r'^[A-Za-z0-9_-]{1,64}$'))
+
+
+def _pipeline(code, shipments='shipments'):
+    """Một round trip: đơn theo order_code + vận đơn theo tracking_code (giống 2 truy vấn cũ)"""
+    return [
+        {'$match': {'order_code': code}},
+        {'$limit': 1},
+        {'$addFields': {'_kind': 'order'}},
+        {'$unionWith': {'coll': shipments, 'pipeline': [
+            {'$match': {'tracking_code': code}},
+            {'$limit': 1},
+            {'$addFields': {'_kind': 'shipment'}},
+        ]}},
+    ]
+
+
+def _lookup(orders, code, shipments):
+    found = {'order': None, 'shipment': None}
+    for doc in orders.aggregate(_pipeline(code, shipments)):
+        kind = doc.pop('_kind')
+        doc['_id'] = str(doc['_id'])
+        found[kind] = doc
+    return found['order'], found['shipment']
+
+
+def lookup(db, code):
+    """Trả về (order, shipment), _id đã chuyển sang chuỗi; không có ở dữ liệu nóng thì tìm trong archive"""
+    order, shipment = _lookup(db.orders, code, 'shipments')
+    if order is None and shipment is None:
+        order, shipment = _lookup(db.orders_archive, code, 'shipments_archive')
+    return order, shipment
+
+
+class TrackingCache:
+    """LRU có TTL theo mã tra cứu; mã không tồn tại được cache riêng (negative) với TTL khác"""
+
+    def __init__(self, max_entries=10000, ttl=15, negative_ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'rejected': 0}
+
+    def get(self, code):
+        """Trả về kết quả đã cache (None nếu không có / hết hạn), hit / miss được đếm trong cùng lock"""
+        with self._lock:
+            item = self._data.get(code)
+            if item is not None and item[0] < time.monotonic():
+                del self._data[code]
+                item = None
+            if item is None:
+                self.stats['misses'] += 1
+                return None
+            self._data.move_to_end(code)
+            self.stats['negative_hits' if not (item[1][0] or item[1][1]) else 'hits'] += 1
+            return item[1]
+
+    def reject(self):
+        with self._lock:
+            self.stats['rejected'] += 1
+
+    def set(self, code, value):
+        ttl = self.ttl if value[0] or value[1] else self.negative_ttl
+        with self._lock:
+            self._data[code] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(code)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *codes):
+        """Không truyền mã thì xóa hết"""
+        with self._lock:
+            if not codes:
+                self._data.clear()
+            for code in codes:
+                self._data.pop(code, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+tracking_cache = TrackingCache(
+    max_entries=int(os.environ.get('TRACK_CACHE_SIZE', 10000)),
+    ttl=int(os.environ.get('TRACK_CACHE_TTL', 15)),
+    negative_ttl=int(os.environ.get('TRACK_CACHE_NEGATIVE_TTL', 60)),
+)
+
+
+def track(db, code):
+    """Tra cứu qua cache. Kết quả dùng chung giữa các request: caller không được sửa tại chỗ."""
+    code = (code or '').strip()
+    if not CODE_PATTERN.match(code):
+        tracking_cache.reject()
+        return None, None
+    cached = tracking_cache.get(code)
+    if cached is not None:
+        return cached
+    result = lookup(db, code)
+    tracking_cache.set(code, result)
+    return result
@@ -0,0 +1,258 @@
+import datetime
+import time
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+from services import dashboard_stats
+from services.cache import invalidate_order, invalidate_orders
+
+# --- MÁY TRẠNG THÁI ĐƠN HÀNG ---
+ALLOWED_TRANSITIONS = {
+    "PENDING_PICKUP": ["PICKED_UP", "CANCELLED"],
+    "PICKED_UP": ["IN_TRANSIT", "CANCELLED"],
+    "IN_TRANSIT": ["DELIVERING", "PICKED_UP"],
+    "DELIVERING": ["DELIVERED", "IN_TRANSIT", "CANCELLED"],
+    "DELIVERED": [],
+    "CANCELLED": []
+}
+
+STATUS_DESCRIPTIONS = {
+    "PENDING_PICKUP": "Đơn hàng đã được tạo",
+    "PICKED_UP": "Shipper đã lấy hàng",
+    "IN_TRANSIT": "Đang luân chuyển",
+    "DELIVERING": "Đang giao hàng",
+    "DELIVERED": "Giao hàng thành công",
+    "CANCELLED": "Đơn hàng đã hủy",
+}
+
+# Kết quả từng đơn trong transition_many
+OK, NOT_FOUND, INVALID, CONFLICT = 'ok', 'not_found', 'invalid_transition', 'conflict'
+# Số lần ghi lại status_history khi không có transaction
+HISTORY_RETRIES = 3
+
+
+class TransitionError(ValueError):
+    def __init__(self, reason, message, current_status=None):
+        super().__init__(message)
+        self.reason = reason
+        self.current_status = current_status
+
+
+def is_allowed(current_status, new_status):
+    return new_status in ALLOWED_TRANSITIONS.get(current_status, [])
+
+
+def predecessors(new_status):
+    return [s for s, nxt in ALLOWED_TRANSITIONS.items() if new_status in nxt]
+
+
+def transition_filter(order_id, new_status):
+    """Đơn chưa xóa mềm, đang ở một trạng thái được phép chuyển sang new_status"""
+    return {'_id': order_id, 'current_status': {'$in': predecessors(new_status)}, 'is_deleted': {'$ne': True}}
+
+
+def _check_status(new_status):
+    if new_status not in ALLOWED_TRANSITIONS:
+        raise TransitionError('unknown_status', f'Trạng thái không hợp lệ: {new_status}')
+
+
+def history_entry(new_status, now, shipper_code=None, location=None, note=None):
+    return {
+        "status_code": new_status,
+        "description": note or STATUS_DESCRIPTIONS.get(new_status, new_status),
+        "timestamp": now,
+        "shipper_code": shipper_code,
+        "location": location,
+    }
+
+
+def shipment_history_update(order, new_status, entry):
+    """(filter, update) $push lịch sử vào vận đơn của đơn; đơn tạo từ app chưa có vận đơn thì tạo mới (upsert)"""
+    update = {
+        '$push': {'status_history': entry},
+        '$set': {'last_updated_at': entry['timestamp']},
+        '$setOnInsert': {'tracking_code': order.get('tracking_code') or order.get('order_code')},
+    }
+    if new_status == 'DELIVERED':
+        update['$set']['actual_delivery_date'] = entry['timestamp']
+    return {'order_id': order['_id']}, update
+
+
+def _shipment_update(order, new_status, entry):
+    return UpdateOne(*shipment_history_update(order, new_status, entry), upsert=True)
+
+
+# --- TRANSACTION (replica set / sharded), fallback ghi tuần tự trên mongod standalone ---
+def supports_transactions(db):
+    try:
+        return db.client.topology_description.topology_type_name in ('ReplicaSetWithPrimary', 'Sharded', 'LoadBalanced')
+    except (AttributeError, PyMongoError):
+        return False
+
+
+def _run(db, fn):
+    if supports_transactions(db):
+        with db.client.start_session() as session:
+            return session.with_transaction(lambda s: fn(s))
+    # Không có transaction: đơn được cập nhật có điều kiện trước, lịch sử ghi ngay sau
+    return fn(None)
+
+
+def _write_history(db, ops, session):
+    """Ghi status_history. Trong transaction lỗi thì cả lượt bị hủy; không có transaction thì
+    trạng thái đơn đã đổi nên thử lại vài lần rồi báo lỗi, trả về False nếu vẫn không ghi được"""
+    if session is not None:
+        db.shipments.bulk_write(ops, ordered=False, session=session)
+        return True
+    for attempt in range(HISTORY_RETRIES):
+        try:
+            db.shipments.bulk_write(ops, ordered=False)
+            return True
+        except PyMongoError as e:
+            error = e
+            time.sleep(0.05 * (attempt + 1))
+    print("⚠️ Không ghi được status_history sau khi đổi trạng thái:", error)
+    return False
+
+
+# --- MỘT ĐƠN ---
+def transition(db, order_id, new_status, shipper_code=None, location=None, note=None):
+    """Đổi trạng thái một đơn bằng find_one_and_update có điều kiện trạng thái trước.
+
+    Trả về bản ghi đơn TRƯỚC khi đổi; đơn đã ở sẵn new_status thì không ghi gì và trả về đơn
+    hiện tại (current_status == new_status). TransitionError nếu không tồn tại / không được phép.
+    """
+    _check_status(new_status)
+    if not isinstance(order_id, ObjectId):
+        try:
+            order_id = ObjectId(order_id)
+        except Exception:
+            raise TransitionError(NOT_FOUND, 'Invalid order id')
+    now = datetime.datetime.utcnow()
+    entry = history_entry(new_status, now, shipper_code, location, note)
+
+    def apply(session):
+        before = db.orders.find_one_and_update(
+            transition_filter(order_id, new_status),
+            {'$set': {'current_status': new_status, 'updated_at': now}},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        if before:
+            if session is None:
+                # Không có transaction: cập nhật bộ đếm ngay khi đơn đã đổi, trước khi ghi lịch sử
+                _record(before)
+            _write_history(db, [_shipment_update(before, new_status, entry)], session)
+        return before
+
+    def _record(before):
+        dashboard_stats.record_status_change(db, before.get('current_status'), new_status,
+                                             deleted=before.get('is_deleted') is True)
+        invalidate_order(before.get('order_code'), before.get('tracking_code'))
+
+    transactional = supports_transactions(db)
+    before = _run(db, apply)
+    if not before:
+        # Chỉ đọc thêm khi thất bại để báo lý do
+        current = db.orders.find_one({'_id': order_id})
+        if not current or current.get('is_deleted') is True:
+            raise TransitionError(NOT_FOUND, 'Order not found')
+        if current.get('current_status') == new_status:
+            return current
+        raise TransitionError(INVALID, f"Không thể chuyển từ {current.get('current_status')} sang {new_status}",
+                              current.get('current_status'))
+
+    if transactional:
+        _record(before)
+    return before
+
+
+# --- NHIỀU ĐƠN (bảng kê xe tải, quét tại bưu cục) ---
+def transition_many(db, new_status, order_ids=None, order_codes=None, shipper_code=None, location=None, note=None,
+                    fields=None):
+    """Đổi trạng thái hàng loạt: 1 lần đọc + 1 bulk_write cho orders + 1 bulk_write cho shipments.
+
+    Mỗi UpdateOne có điều kiện đúng trạng thái vừa đọc và gắn last_transition_id; chỉ khi có
+    đơn bị đổi song song (modified < số lệnh) mới đọc lại theo marker để biết đơn nào xung đột.
+    Trả về (results, changed): results là [{key, order_id, order_code, outcome, ...}] theo thứ tự đầu vào,
+    changed là các đơn đã đổi (kèm thêm các field trong fields, vd. để tạo notification).
+    Đơn đã ở sẵn new_status là OK với unchanged=True và không được ghi lại; history_missing=True khi
+    không có transaction và ghi status_history thất bại.
+    """
+    _check_status(new_status)
+    by_code = order_codes is not None
+    keys = list(order_codes if by_code else order_ids or [])
+    now = datetime.datetime.utcnow()
+    marker = ObjectId()
+    entry = history_entry(new_status, now, shipper_code, location, note)
+
+    lookup_keys = keys if by_code else [ObjectId(k) for k in keys if ObjectId.is_valid(k)]
+    field = 'order_code' if by_code else '_id'
+    found = {d[field]: d for d in db.orders.find(
+        {field: {'$in': lookup_keys}, 'is_deleted': {'$ne': True}},
+        dict.fromkeys(['order_code', 'current_status', 'tracking_code'] + list(fields or []), 1)
+    )}
+
+    results, candidates, seen = [], [], set()
+    for k in keys:
+        doc = found.get(k if by_code else (ObjectId(k) if ObjectId.is_valid(k) else None))
+        item = {'key': k}
+        if not doc:
+            item['outcome'] = NOT_FOUND
+        elif doc['_id'] in seen:
+            item.update(order_id=str(doc['_id']), order_code=doc.get('order_code'), outcome=OK, duplicate=True)
+        elif doc.get('current_status') == new_status:
+            seen.add(doc['_id'])
+            item.update(order_id=str(doc['_id']), order_code=doc.get('order_code'), outcome=OK, unchanged=True)
+        elif not is_allowed(doc.get('current_status'), new_status):
+            item.update(order_id=str(doc['_id']), order_code=doc.get('order_code'), outcome=INVALID,
+                        current_status=doc.get('current_status'))
+        else:
+            seen.add(doc['_id'])
+            item.update(order_id=str(doc['_id']), order_code=doc.get('order_code'), outcome=OK,
+                        previous_status=doc.get('current_status'))
+            candidates.append((item, doc))
+        results.append(item)
+
+    if not candidates:
+        return results, []
+
+    def apply(session):
+        # with_transaction có thể chạy lại hàm này khi gặp lỗi tạm thời
+        for item, _ in candidates:
+            item['outcome'] = OK
+        res = db.orders.bulk_write([
+            UpdateOne(
+                {'_id': doc['_id'], 'current_status': doc.get('current_status')},
+                {'$set': {'current_status': new_status, 'updated_at': now, 'last_transition_id': marker}}
+            ) for _, doc in candidates
+        ], ordered=False, session=session)
+        changed = candidates
+        if res.modified_count < len(candidates):
+            applied = {d['_id'] for d in db.orders.find(
+                {'_id': {'$in': [doc['_id'] for _, doc in candidates]}, 'last_transition_id': marker},
+                {'_id': 1}, session=session)}
+            changed = []
+            for item, doc in candidates:
+                if doc['_id'] in applied:
+                    changed.append((item, doc))
+                else:
+                    item['outcome'] = CONFLICT
+        if changed:
+            if session is None:
+                # Không có transaction: cập nhật bộ đếm ngay khi đơn đã đổi, trước khi ghi lịch sử
+                _record(changed)
+            if not _write_history(db, [_shipment_update(doc, new_status, entry) for _, doc in changed], session):
+                for item, _ in changed:
+                    item['history_missing'] = True
+        return changed
+
+    def _record(changed):
+        dashboard_stats.record_status_changes(db, [(doc.get('current_status'), new_status) for _, doc in changed])
+        invalidate_orders([doc for _, doc in changed])
+
+    transactional = supports_transactions(db)
+    changed = _run(db, apply)
+    if transactional:
+        _record(changed)
+    return results, [doc for _, doc in changed]
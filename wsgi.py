@@ -0,0 +1,7 @@
+"""Entry point WSGI cho production:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import app
+
+application = app